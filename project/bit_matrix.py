@@ -0,0 +1,212 @@
+from typing import Iterator, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, spmatrix
+
+NONZERO_CHUNK_CELLS = 1 << 24
+GATHER_CHUNK_WORDS = 1 << 21
+
+
+class BitMatrix:
+    """
+    Boolean matrix packed into rows of uint64 words: bit j % 64 of words[i, j // 64] is the cell (i, j).
+    A cell takes a single bit, so near-dense reachability matrices take 8 times less memory than
+    bool arrays and far less than sparse formats. Bits past the last column are always zero.
+    """
+
+    __slots__ = ("words", "shape")
+
+    def __init__(self, words: np.ndarray, shape: Tuple[int, int]):
+        self.words = words
+        self.shape = (int(shape[0]), int(shape[1]))
+
+    @classmethod
+    def zeros(cls, shape: Tuple[int, int]) -> "BitMatrix":
+        return cls(np.zeros((shape[0], _count_words(shape[1])), dtype=np.uint64), shape)
+
+    @classmethod
+    def identity(cls, count: int) -> "BitMatrix":
+        return cls.from_coo(np.arange(count), np.arange(count), (count, count))
+
+    @classmethod
+    def from_coo(
+        cls, rows: np.ndarray, columns: np.ndarray, shape: Tuple[int, int]
+    ) -> "BitMatrix":
+        """Returns the matrix with the given set cells."""
+        matrix = cls.zeros(shape)
+        columns = np.asarray(columns, dtype=np.uint64)
+        np.bitwise_or.at(
+            matrix.words,
+            (
+                np.asarray(rows, dtype=np.int64),
+                (columns >> np.uint64(6)).astype(np.int64),
+            ),
+            np.uint64(1) << (columns & np.uint64(63)),
+        )
+        return matrix
+
+    @classmethod
+    def from_sparse(cls, matrix: spmatrix) -> "BitMatrix":
+        rows, columns = matrix.nonzero()
+        return cls.from_coo(rows, columns, matrix.shape)
+
+    @classmethod
+    def from_dense(cls, matrix: np.ndarray) -> "BitMatrix":
+        rows, columns = matrix.shape
+        packed = np.packbits(matrix.astype(bool), axis=1, bitorder="little")
+        padded = np.zeros((rows, _count_words(columns) * 8), dtype=np.uint8)
+        padded[:, : packed.shape[1]] = packed
+        return cls(padded.view("<u8").astype(np.uint64), (rows, columns))
+
+    def to_dense(self) -> np.ndarray:
+        return self._unpack(0, self.shape[0])
+
+    def to_csr(self) -> csr_matrix:
+        rows, columns = self.nonzero()
+        return csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, columns)), shape=self.shape
+        )
+
+    def copy(self) -> "BitMatrix":
+        return BitMatrix(self.words.copy(), self.shape)
+
+    @property
+    def nnz(self) -> int:
+        return popcount(self.words)
+
+    def nonzero(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns row and column indexes of the set cells, ordered by rows."""
+        parts = list(self.iter_nonzero())
+        if not parts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        return (
+            np.concatenate([rows for rows, _ in parts]),
+            np.concatenate([columns for _, columns in parts]),
+        )
+
+    def iter_nonzero(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yields the set cells by blocks of rows, so the unpacked bits stay within NONZERO_CHUNK_CELLS."""
+        step = max(NONZERO_CHUNK_CELLS // max(self.words.shape[1] * 64, 1), 1)
+        for begin in range(0, self.shape[0], step):
+            rows, columns = np.nonzero(self._unpack(begin, begin + step))
+            yield rows + begin, columns
+
+    def __or__(self, other: "BitMatrix") -> "BitMatrix":
+        return BitMatrix(self.words | other.words, self.shape)
+
+    def __ior__(self, other: "BitMatrix") -> "BitMatrix":
+        """OR-accumulates the other matrix in place."""
+        self.words |= other.words
+        return self
+
+    def __and__(self, other: "BitMatrix") -> "BitMatrix":
+        return BitMatrix(self.words & other.words, self.shape)
+
+    def difference(self, other: "BitMatrix") -> "BitMatrix":
+        """Cells that are set in this matrix and not set in the other one."""
+        return BitMatrix(self.words & ~other.words, self.shape)
+
+    def __matmul__(self, other: "BitMatrix") -> "BitMatrix":
+        """
+        Boolean product computed on words: row i of the product is the OR of the rows
+        of the other matrix selected by the set bits of row i of this one.
+        """
+        words = np.zeros((self.shape[0], other.words.shape[1]), dtype=np.uint64)
+        for rows, columns in self.iter_nonzero():
+            _gather_rows(words, rows, columns, other)
+        return BitMatrix(words, (self.shape[0], other.shape[1]))
+
+    def left_multiply(self, other: spmatrix) -> "BitMatrix":
+        """Boolean product other @ self of a sparse matrix by this one, the sparse matrix is never unpacked."""
+        other = csr_matrix(other)
+        if not other.has_sorted_indices:
+            other = other.sorted_indices()
+        words = np.zeros((other.shape[0], self.words.shape[1]), dtype=np.uint64)
+        rows = np.repeat(np.arange(other.shape[0]), np.diff(other.indptr))
+        _gather_rows(words, rows, other.indices, self)
+        return BitMatrix(words, (other.shape[0], self.shape[1]))
+
+    def transpose(self) -> "BitMatrix":
+        """Returns the transposed matrix, repacking blocks of 64 rows into words of the columns."""
+        count_rows, count_columns = self.shape
+        result = BitMatrix.zeros((count_columns, count_rows))
+        step = 64 * max(NONZERO_CHUNK_CELLS // max(64 * count_columns, 1), 1)
+        for begin in range(0, count_rows, step):
+            bits = np.zeros((step, count_columns), dtype=bool)
+            block = self._unpack(begin, begin + step)
+            bits[: len(block)] = block
+            packed = np.packbits(bits.T, axis=1, bitorder="little")
+            words = np.ascontiguousarray(packed).view("<u8").astype(np.uint64)
+            end = min(begin // 64 + words.shape[1], result.words.shape[1])
+            result.words[:, begin // 64 : end] = words[:, : end - begin // 64]
+        return result
+
+    @property
+    def T(self) -> "BitMatrix":
+        return self.transpose()
+
+    def select_rows(self, rows: np.ndarray) -> "BitMatrix":
+        """Returns the matrix made of the given rows."""
+        return BitMatrix(self.words[rows], (len(rows), self.shape[1]))
+
+    def masked(
+        self, rows_mask: np.ndarray = None, columns_mask: np.ndarray = None
+    ) -> "BitMatrix":
+        """
+        Returns the matrix keeping only the cells whose row and column are marked in the boolean masks.
+        A mask that is None keeps all rows or columns.
+        """
+        words = self.words.copy()
+        if columns_mask is not None:
+            words &= BitMatrix.from_dense(columns_mask[None, :]).words
+        if rows_mask is not None:
+            words[~rows_mask] = 0
+        return BitMatrix(words, self.shape)
+
+    def transitive_closure(self) -> "BitMatrix":
+        """
+        Returns the transitive closure of the square matrix by Warshall's algorithm on words:
+        for every vertex k, the rows that reach k are OR-accumulated with the row of k.
+        """
+        words = self.words.copy()
+        for k in range(self.shape[0]):
+            reach_k = (words[:, k >> 6] >> np.uint64(k & 63)) & np.uint64(1)
+            rows = np.flatnonzero(reach_k)
+            if len(rows):
+                words[rows] |= words[k]
+        return BitMatrix(words, self.shape)
+
+    def _unpack(self, begin: int, end: int) -> np.ndarray:
+        """Returns the rows begin..end as a bool array."""
+        return np.unpackbits(
+            self.words[begin:end].astype("<u8").view(np.uint8),
+            axis=1,
+            count=self.shape[1],
+            bitorder="little",
+        ).astype(bool)
+
+
+def _gather_rows(
+    words: np.ndarray, rows: np.ndarray, columns: np.ndarray, other: BitMatrix
+) -> None:
+    """ORs the row columns[i] of the other matrix into the row rows[i] of words, rows are sorted."""
+    step = max(GATHER_CHUNK_WORDS // max(other.words.shape[1], 1), 1)
+    for begin in range(0, len(rows), step):
+        chunk_rows = rows[begin : begin + step]
+        chunk_columns = columns[begin : begin + step]
+        starts = np.flatnonzero(np.r_[True, chunk_rows[1:] != chunk_rows[:-1]])
+        words[chunk_rows[starts]] |= np.bitwise_or.reduceat(
+            other.words[chunk_columns], starts, axis=0
+        )
+
+
+def _count_words(count_bits: int) -> int:
+    return (count_bits + 63) // 64
+
+
+def popcount(words: np.ndarray) -> int:
+    """Returns the count of set bits in an array of unsigned words."""
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum())
+    return int(np.unpackbits(words.view(np.uint8)).sum())
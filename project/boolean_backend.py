@@ -0,0 +1,263 @@
+from abc import ABC, abstractmethod
+from typing import Any, Tuple, Union
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csr_matrix, spmatrix
+
+from project.bit_matrix import BitMatrix
+
+DENSE_MAX_SIZE = 512
+BITSET_MIN_DENSITY = 1 / 64
+
+
+class BooleanBackend(ABC):
+    """
+    Operations over boolean matrices stored in one format.
+    Matrices are never modified in place, every operation returns a new matrix.
+    """
+
+    name = None
+
+    @abstractmethod
+    def from_coo(
+        self, rows: np.ndarray, columns: np.ndarray, shape: Tuple[int, int]
+    ) -> Any:
+        """Returns the matrix with the given set cells."""
+
+    def from_sparse(self, matrix: spmatrix) -> Any:
+        rows, columns = matrix.nonzero()
+        return self.from_coo(rows, columns, matrix.shape)
+
+    def to_csr(self, matrix: Any) -> csr_matrix:
+        rows, columns = self.nonzero(matrix)
+        return csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, columns)), shape=self.shape(matrix)
+        )
+
+    def zeros(self, shape: Tuple[int, int]) -> Any:
+        empty = np.empty(0, dtype=np.int64)
+        return self.from_coo(empty, empty, shape)
+
+    def identity(self, count: int) -> Any:
+        return self.from_coo(np.arange(count), np.arange(count), (count, count))
+
+    def shape(self, matrix: Any) -> Tuple[int, int]:
+        return matrix.shape
+
+    @abstractmethod
+    def multiply(self, first: Any, second: Any) -> Any:
+        """Boolean matrix product."""
+
+    def multiply_sparse(self, first: csr_matrix, second: Any) -> Any:
+        """Boolean product of a CSR matrix by a matrix of the backend."""
+        return self.multiply(self.from_sparse(first), second)
+
+    @abstractmethod
+    def add(self, first: Any, second: Any) -> Any:
+        """Cell-wise OR."""
+
+    @abstractmethod
+    def difference(self, first: Any, second: Any) -> Any:
+        """Cells that are set in the first matrix and not set in the second one."""
+
+    @abstractmethod
+    def kron(self, first: Any, second: Any) -> Any:
+        """Kronecker product."""
+
+    @abstractmethod
+    def transpose(self, matrix: Any) -> Any:
+        """Transposed matrix."""
+
+    @abstractmethod
+    def nnz(self, matrix: Any) -> int:
+        """Count of the set cells."""
+
+    @abstractmethod
+    def nonzero(self, matrix: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns row and column indexes of the set cells, ordered by rows."""
+
+    def select_nonzero(
+        self, matrix: Any, rows: np.ndarray, columns_mask: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the set cells in the rows with the given sorted indexes whose column is marked in the boolean mask."""
+        all_rows, columns = self.nonzero(matrix)
+        selected = np.isin(all_rows, rows) & columns_mask[columns]
+        return all_rows[selected], columns[selected]
+
+
+class CsrBackend(BooleanBackend):
+    """SciPy CSR matrices, suited for large sparse matrices."""
+
+    name = "csr"
+
+    def from_coo(self, rows, columns, shape):
+        return csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, columns)), shape=shape
+        )
+
+    def from_sparse(self, matrix):
+        return csr_matrix(matrix, dtype=bool)
+
+    def to_csr(self, matrix):
+        return matrix
+
+    def identity(self, count):
+        return sp.identity(count, dtype=bool, format="csr")
+
+    def multiply(self, first, second):
+        return first @ second
+
+    def multiply_sparse(self, first, second):
+        return first @ second
+
+    def add(self, first, second):
+        return first + second
+
+    def difference(self, first, second):
+        return (first > second).tocsr()
+
+    def kron(self, first, second):
+        return sp.kron(first, second, format="csr")
+
+    def transpose(self, matrix):
+        return matrix.T.tocsr()
+
+    def nnz(self, matrix):
+        return matrix.nnz
+
+    def nonzero(self, matrix):
+        return matrix.nonzero()
+
+    def select_nonzero(self, matrix, rows, columns_mask):
+        selected_rows, columns = matrix[rows].nonzero()
+        selected = columns_mask[columns]
+        return rows[selected_rows[selected]], columns[selected]
+
+
+class DenseBackend(BooleanBackend):
+    """NumPy bool arrays, suited for small or dense matrices."""
+
+    name = "dense"
+
+    def from_coo(self, rows, columns, shape):
+        matrix = np.zeros(shape, dtype=bool)
+        matrix[rows, columns] = True
+        return matrix
+
+    def from_sparse(self, matrix):
+        return matrix.toarray().astype(bool)
+
+    def to_csr(self, matrix):
+        return csr_matrix(matrix)
+
+    def identity(self, count):
+        return np.eye(count, dtype=bool)
+
+    def multiply(self, first, second):
+        # Float products go through BLAS and stay exact while the sums are below 2 ** 24.
+        return (first.astype(np.float32) @ second.astype(np.float32)) > 0
+
+    def multiply_sparse(self, first, second):
+        return (first.astype(np.float32) @ second.astype(np.float32)) > 0
+
+    def add(self, first, second):
+        return first | second
+
+    def difference(self, first, second):
+        return first & ~second
+
+    def kron(self, first, second):
+        return np.kron(first, second)
+
+    def transpose(self, matrix):
+        return np.ascontiguousarray(matrix.T)
+
+    def nnz(self, matrix):
+        return int(np.count_nonzero(matrix))
+
+    def nonzero(self, matrix):
+        return np.nonzero(matrix)
+
+    def select_nonzero(self, matrix, rows, columns_mask):
+        selected_rows, columns = np.nonzero(matrix[rows] & columns_mask[None, :])
+        return rows[selected_rows], columns
+
+
+class BitsetBackend(BooleanBackend):
+    """BitMatrix rows of uint64 words, suited for large matrices with a high density."""
+
+    name = "bitset"
+
+    def from_coo(self, rows, columns, shape):
+        return BitMatrix.from_coo(rows, columns, shape)
+
+    def from_sparse(self, matrix):
+        return BitMatrix.from_sparse(matrix)
+
+    def to_csr(self, matrix):
+        return matrix.to_csr()
+
+    def zeros(self, shape):
+        return BitMatrix.zeros(shape)
+
+    def multiply(self, first, second):
+        return first @ second
+
+    def multiply_sparse(self, first, second):
+        return second.left_multiply(first)
+
+    def add(self, first, second):
+        return first | second
+
+    def difference(self, first, second):
+        return first.difference(second)
+
+    def kron(self, first, second):
+        return BitMatrix.from_sparse(sp.kron(first.to_csr(), second.to_csr()))
+
+    def transpose(self, matrix):
+        return matrix.transpose()
+
+    def nnz(self, matrix):
+        return matrix.nnz
+
+    def nonzero(self, matrix):
+        return matrix.nonzero()
+
+    def select_nonzero(self, matrix, rows, columns_mask):
+        selected_rows, columns = (
+            matrix.select_rows(rows).masked(None, columns_mask).nonzero()
+        )
+        return rows[selected_rows], columns
+
+
+CSR = CsrBackend()
+DENSE = DenseBackend()
+BITSET = BitsetBackend()
+BACKENDS = {backend.name: backend for backend in (CSR, DENSE, BITSET)}
+
+
+def choose_backend(size: int, density: float) -> BooleanBackend:
+    """
+    Returns the default backend for matrices of the given size and density of set cells:
+    dense arrays for small matrices, bitsets for dense large ones, CSR otherwise.
+    """
+    if size <= DENSE_MAX_SIZE:
+        return DENSE
+    if density >= BITSET_MIN_DENSITY:
+        return BITSET
+    return CSR
+
+
+def get_backend(
+    backend: Union[str, BooleanBackend, None], size: int = 0, density: float = 0.0
+) -> BooleanBackend:
+    """Resolves a backend given by name or instance, choosing it by size and density if None."""
+    if backend is None:
+        return choose_backend(size, density)
+    if isinstance(backend, BooleanBackend):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown boolean matrix backend: {backend}")
+    return BACKENDS[backend]
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, NamedTuple
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+    weight: int = 0
+
+
+class LRUCache:
+    """
+    Bounded thread-safe mapping that evicts the least recently used entries.
+    Values are created outside of the lock, so a slow creation does not block other readers.
+    :param max_size: maximal count of entries
+    :param max_weight: if not None, the entries are also evicted while their total weight exceeds it
+    :param weigh: weight of a value, e.g. its size in bytes; every value weighs 1 if None
+    """
+
+    def __init__(
+        self,
+        max_size: int = 128,
+        max_weight: int = None,
+        weigh: Callable[[Any], int] = None,
+    ):
+        self.max_size = max_size
+        self.max_weight = max_weight
+        self._weigh = weigh or (lambda value: 1)
+        self._entries = OrderedDict()
+        self._weights = dict()
+        self._weight = 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value and marks it as recently used, default if it is absent."""
+        with self._lock:
+            if key in self._entries:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self._misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores the value, evicting the least recently used entries over the limits.
+        A value heavier than max_weight is not stored at all.
+        """
+        weight = self._weigh(value)
+        if self.max_weight is not None and weight > self.max_weight:
+            self.invalidate(key)
+            return
+
+        with self._lock:
+            self._weight += weight - self._weights.get(key, 0)
+            self._entries[key] = value
+            self._weights[key] = weight
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size or (
+                self.max_weight is not None and self._weight > self.max_weight
+            ):
+                evicted, _ = self._entries.popitem(last=False)
+                self._weight -= self._weights.pop(evicted)
+
+    def get_or_create(self, key: Hashable, create: Callable[[], Any]) -> Any:
+        """Returns the cached value, creating and storing it on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = create()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """Removes the entry if it is present."""
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+                self._weight -= self._weights.pop(key)
+
+    def clear(self) -> None:
+        """Removes all entries and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._weights.clear()
+            self._weight = 0
+            self._hits = 0
+            self._misses = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                self._hits,
+                self._misses,
+                len(self._entries),
+                self.max_size,
+                self._weight,
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
@@ -2,13 +2,15 @@ from pathlib import Path
 from typing import Set, Tuple
 
 from pyformlang.cfg import CFG
-from networkx import MultiDiGraph
+import numpy as np
 
 from project.cfg_utils import cfg_to_wcnf, cfg_str_to_wcnf, read_cfg
+from project.graph_cache import get_graph_decomposition
+from project.sparse_graph import AnyGraph
 
 
 def cfg_str_transitive_closure(
-    graph: MultiDiGraph, cfg_text: str, start: str = "S"
+    graph: AnyGraph, cfg_text: str, start: str = "S"
 ) -> Set[Tuple]:
     """
     Translation text to CFG and execution of the Helling algorithm on it
@@ -17,7 +19,7 @@ def cfg_str_transitive_closure(
 
 
 def read_cfg_and_transitive_closure(
-    graph: MultiDiGraph, path: Path, start: str = "S"
+    graph: AnyGraph, path: Path, start: str = "S"
 ) -> Set[Tuple]:
     """
     Read CFG from given path and execution of the Helling algorithm on it
@@ -26,7 +28,7 @@ def read_cfg_and_transitive_closure(
 
 
 def cfpg_transitive_closure(
-    graph: MultiDiGraph,
+    graph: AnyGraph,
     cfg: CFG,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
@@ -60,14 +62,20 @@ def cfpg_transitive_closure(
             elif not prod.body:
                 eps_productions.add(prod.head.value)
 
+        decomposition = get_graph_decomposition(graph)
+        vertices, edges = decomposition.vertices, decomposition.matrices
         helling_result = {
-            (label, node, node) for node in graph.nodes for label in eps_productions
-        } | {
-            (term.head.value, v, u)
-            for (v, u, label) in graph.edges(data="label")
-            for term in term_productions
-            if term.body[0].value == label
+            (label, node, node) for node in vertices for label in eps_productions
         }
+        for edge_label, matrix in edges.items():
+            heads = [
+                term.head.value
+                for term in term_productions
+                if term.body[0].value == edge_label
+            ]
+            if heads:
+                pairs = vertices.to_ids(np.array(matrix.nonzero())).T.tolist()
+                helling_result |= {(head, v, u) for head in heads for v, u in pairs}
 
         saved_result = helling_result.copy()
         while saved_result:
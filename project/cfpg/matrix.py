@@ -1,15 +1,20 @@
 from pathlib import Path
-from typing import Set, Tuple
+from typing import Any, Dict, Iterator, Set, Tuple, Union
 
 from pyformlang.cfg import CFG
-from networkx import MultiDiGraph
-from scipy.sparse import dok_matrix
+import numpy as np
+from scipy.sparse import csr_matrix, identity as identity_matrix
 
+from project.boolean_backend import BooleanBackend, get_backend
 from project.cfg_utils import cfg_to_wcnf, cfg_str_to_wcnf, read_cfg
+from project.finite_automatons_utils import decomposition_density
+from project.closure import semi_naive_products_closure
+from project.graph_cache import get_graph_decomposition
+from project.sparse_graph import AnyGraph, VertexIndex
 
 
 def cfg_str_transitive_closure(
-    graph: MultiDiGraph, cfg_text: str, start: str = "S"
+    graph: AnyGraph, cfg_text: str, start: str = "S"
 ) -> Set[Tuple]:
     """
     Translation text to CFG and execution of the Matrix algorithm on it
@@ -18,7 +23,7 @@ def cfg_str_transitive_closure(
 
 
 def read_cfg_and_transitive_closure(
-    graph: MultiDiGraph, path: Path, start: str = "S"
+    graph: AnyGraph, path: Path, start: str = "S"
 ) -> Set[Tuple]:
     """
     Read CFG from given path and execution of the Matrix algorithm on it
@@ -27,10 +32,11 @@ def read_cfg_and_transitive_closure(
 
 
 def cfpg_transitive_closure(
-    graph: MultiDiGraph,
+    graph: AnyGraph,
     cfg: CFG,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
+    backend: Union[str, BooleanBackend] = None,
 ) -> Set[Tuple]:
     """
     Calculation of Matrix algorithm
@@ -38,62 +44,95 @@ def cfpg_transitive_closure(
     :param cfg: this cfg needed for algorithm
     :param start_nodes: if list is None, then nodes from the graph will be taken
     :param final_nodes: if list is None, then nodes from the graph will be taken
+    :param backend: "csr", "dense", "bitset" or a BooleanBackend the closure is computed with.
+        If None, it is chosen by the size and density of the graph.
     :return:
     """
-    if start_nodes is None:
-        start_nodes = graph.nodes
-    if final_nodes is None:
-        final_nodes = graph.nodes
-    start_symbol = cfg.start_symbol.value
-
-    def execute():
-        count = graph.number_of_nodes()
-
-        wcnf = cfg_to_wcnf(cfg)
-        eps_productions = set()
-        term_productions = set()
-        var_productions = set()
-
-        for prod in wcnf.productions:
-            if len(prod.body) == 1:
-                term_productions.add(prod)
-            elif len(prod.body) == 2:
-                var_productions.add((prod.head, prod.body[0], prod.body[1]))
-            elif not prod.body:
-                eps_productions.add(prod.head.value)
-
-        matrices = {
-            non_terminal.value: dok_matrix((count, count), dtype=bool)
-            for non_terminal in wcnf.variables
-        }
-
-        for i, j, label in graph.edges(data="label"):
-            for non_terminal in (
-                tp.head.value for tp in term_productions if tp.body[0].value == label
-            ):
-                matrices[non_terminal][i, j] = True
-
-        for i in range(count):
-            for non_terminal in eps_productions:
-                matrices[non_terminal][i, i] = True
-
-        changed = True
-        while changed:
-            changed = False
-            for h, b1, b2 in var_productions:
-                nnz_old = matrices[h].nnz
-                matrices[h] += matrices[b1] @ matrices[b2]
-                changed |= matrices[h].nnz != nnz_old
-
-        return {
-            (non_terminal, i, j)
-            for non_terminal, matrix in matrices.items()
-            for i, j in zip(*matrix.nonzero())
-        }
-
-    result = {
+    return {
         (x, y)
-        for (label, x, y) in execute()
-        if x in start_nodes and y in final_nodes and label == start_symbol
+        for pairs in iter_cfpg_transitive_closure(
+            graph,
+            cfg,
+            start_nodes,
+            final_nodes,
+            backend,
+            chunk_size=max(graph.number_of_nodes(), 1),
+        )
+        for x, y in pairs.tolist()
     }
-    return result
+
+
+def iter_cfpg_transitive_closure(
+    graph: AnyGraph,
+    cfg: CFG,
+    start_nodes: Set[int] = None,
+    final_nodes: Set[int] = None,
+    backend: Union[str, BooleanBackend] = None,
+    chunk_size: int = 1024,
+) -> Iterator[np.ndarray]:
+    """
+    Matrix algorithm streaming the pairs of vertices derived from the start symbol
+    as arrays of shape (k, 2), one array per block of chunk_size start vertices.
+    Only the closed matrices are kept in memory. See cfpg_transitive_closure for the other parameters.
+    """
+    vertices, closure_backend, matrices = _matrix_closure(graph, cfg, backend)
+    matrix = matrices.get(cfg.start_symbol.value)
+    if matrix is None:
+        return
+
+    start_mask = vertices.mask(start_nodes)
+    final_mask = vertices.mask(final_nodes)
+    for begin in range(0, len(vertices), chunk_size):
+        rows = begin + np.flatnonzero(start_mask[begin : begin + chunk_size])
+        if not len(rows):
+            continue
+
+        pairs = np.column_stack(
+            closure_backend.select_nonzero(matrix, rows, final_mask)
+        )
+        if len(pairs):
+            yield vertices.to_ids(pairs)
+
+
+def _matrix_closure(
+    graph: AnyGraph, cfg: CFG, backend: Union[str, BooleanBackend] = None
+) -> Tuple[VertexIndex, BooleanBackend, Dict[Any, Any]]:
+    """Returns the vertices of the graph, the chosen backend and the closed matrices of all non-terminals."""
+    decomposition = get_graph_decomposition(graph)
+    vertices, edges = decomposition.vertices, decomposition.matrices
+    count = len(vertices)
+
+    wcnf = cfg_to_wcnf(cfg)
+    eps_productions = set()
+    term_productions = set()
+    var_productions = set()
+
+    for prod in wcnf.productions:
+        if len(prod.body) == 1:
+            term_productions.add(prod)
+        elif len(prod.body) == 2:
+            var_productions.add((prod.head, prod.body[0], prod.body[1]))
+        elif not prod.body:
+            eps_productions.add(prod.head.value)
+
+    matrices = {
+        non_terminal.value: csr_matrix((count, count), dtype=bool)
+        for non_terminal in wcnf.variables
+    }
+
+    for label, matrix in edges.items():
+        for non_terminal in (
+            tp.head.value for tp in term_productions if tp.body[0].value == label
+        ):
+            matrices[non_terminal] = matrices[non_terminal] + matrix
+
+    identity = identity_matrix(count, dtype=bool, format="csr")
+    for non_terminal in eps_productions:
+        matrices[non_terminal] = matrices[non_terminal] + identity
+
+    _, density = decomposition_density(edges)
+    closure_backend = get_backend(backend, count, density)
+    matrices, _ = semi_naive_products_closure(
+        matrices, var_productions, closure_backend
+    )
+    return vertices, closure_backend, matrices
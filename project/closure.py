@@ -0,0 +1,223 @@
+from typing import Any, Dict, Iterable, NamedTuple, Tuple, Union
+
+import numpy as np
+from scipy.sparse import csr_matrix, spmatrix
+from scipy.sparse.csgraph import connected_components
+
+from project.boolean_backend import CSR, BooleanBackend
+
+
+class Closure(NamedTuple):
+    """Closed matrix in the format of the backend it was computed with and the number of rounds taken."""
+
+    matrix: Any
+    rounds: int
+
+
+def boolean_difference(first: spmatrix, second: spmatrix) -> csr_matrix:
+    """Returns the cells that are set in the first boolean matrix and not set in the second one."""
+    return (first > second).tocsr()
+
+
+def union_of_decomposition(matrix: Dict[Any, spmatrix]) -> csr_matrix:
+    """Returns the union of all matrices of a boolean decomposition."""
+    return sum(m.tocsr() for m in matrix.values()).astype(bool)
+
+
+def semi_naive_transitive_closure(
+    matrix: Union[Dict[Any, spmatrix], spmatrix],
+    squaring: bool = False,
+    backend: BooleanBackend = CSR,
+) -> Closure:
+    """
+    Returns the transitive closure of a boolean matrix and the number of rounds taken.
+    Every round multiplies only the pairs discovered on the previous round.
+    :param matrix: boolean matrix or boolean decomposition whose union is closed
+    :param squaring: if True, the delta is multiplied by the whole closure (repeated squaring),
+        otherwise by the base relation (linear frontier expansion)
+    :param backend: boolean matrix backend the rounds are computed with
+    :return: closure in the format of the backend and count of rounds
+    """
+    if isinstance(matrix, dict):
+        if not matrix:
+            return Closure(backend.zeros((0, 0)), 0)
+        base = union_of_decomposition(matrix)
+    else:
+        base = csr_matrix(matrix, dtype=bool)
+    base = backend.from_sparse(base)
+
+    closure = base
+    delta = base
+    rounds = 0
+    while backend.nnz(delta):
+        rounds += 1
+        if squaring:
+            new = backend.add(
+                backend.multiply(delta, closure), backend.multiply(closure, delta)
+            )
+        else:
+            new = backend.multiply(delta, base)
+        delta = backend.difference(new, closure)
+        closure = backend.add(closure, delta)
+
+    return Closure(closure, rounds)
+
+
+def semi_naive_products_closure(
+    matrices: Dict[Any, spmatrix],
+    products: Iterable[Tuple[Any, Any, Any]],
+    backend: BooleanBackend = CSR,
+) -> Tuple[Dict[Any, Any], int]:
+    """
+    Closes the boolean matrices under the rules matrices[head] |= matrices[left] @ matrices[right].
+    Every round multiplies only the cells discovered on the previous round.
+    :param matrices: initial matrices, one for every key used in the products
+    :param products: triples (head, left, right)
+    :param backend: boolean matrix backend the rounds are computed with
+    :return: closed matrices in the format of the backend and count of rounds
+    """
+    products = list(products)
+    matrices = {key: backend.from_sparse(m) for key, m in matrices.items()}
+    deltas = {key: m for key, m in matrices.items() if backend.nnz(m)}
+    rounds = 0
+    while deltas:
+        rounds += 1
+        new = dict()
+        for head, left, right in products:
+            parts = []
+            if left in deltas:
+                parts.append(backend.multiply(deltas[left], matrices[right]))
+            if right in deltas:
+                parts.append(backend.multiply(matrices[left], deltas[right]))
+            for product in parts:
+                new[head] = backend.add(new[head], product) if head in new else product
+
+        deltas = dict()
+        for head, m in new.items():
+            delta = backend.difference(m, matrices[head])
+            if backend.nnz(delta):
+                deltas[head] = delta
+                matrices[head] = backend.add(matrices[head], delta)
+
+    return matrices, rounds
+
+
+class CondensedClosure(NamedTuple):
+    """
+    Transitive closure stored over the condensation of a graph into strongly connected components.
+    components[i] is the component of the vertex i, membership[i, components[i]] is set for every vertex,
+    dag is the condensed graph without loops and cyclic marks the components every vertex of which
+    reaches itself. Reachability is propagated only from the components the pairs are requested for.
+    """
+
+    components: np.ndarray
+    membership: csr_matrix
+    dag: csr_matrix
+    cyclic: np.ndarray
+
+    def reach(self, sources: np.ndarray) -> csr_matrix:
+        """
+        Returns the boolean matrix whose row i marks the components reachable from the component sources[i]
+        by a non-empty path. Every round multiplies only the components discovered on the previous round.
+        """
+        count = len(sources)
+        selector = csr_matrix(
+            (np.ones(count, dtype=bool), (np.arange(count), sources)),
+            shape=(count, len(self.cyclic)),
+        )
+        reach = (selector @ self.dag).tocsr()
+        delta = reach
+        while delta.nnz:
+            delta = boolean_difference(delta @ self.dag, reach)
+            reach = reach + delta
+        cyclic = self.cyclic[sources]
+        return (reach + selector.multiply(cyclic[:, None])).tocsr()
+
+    def reachable_components(self, component: int) -> np.ndarray:
+        """Returns the indexes of components reachable from the given component."""
+        return np.sort(self.reach(np.array([component])).indices)
+
+    def targets(self, columns_mask: np.ndarray = None) -> csr_matrix:
+        """
+        Returns the transposed membership of the marked vertices, the argument of pairs.
+        :param columns_mask: if None, then all vertices are marked
+        """
+        matrix = self.membership.T.tocsr()
+        if columns_mask is not None:
+            matrix = matrix.multiply(columns_mask[None, :]).tocsr()
+        return matrix
+
+    def pairs(self, rows: np.ndarray = None, targets: csr_matrix = None) -> np.ndarray:
+        """
+        Expands the closure into unique pairs of vertices of shape (k, 2), sorted by the source.
+        :param rows: indexes of the source vertices, if None, then pairs from all vertices are produced
+        :param targets: result of targets for the vertices the pairs lead to, if None, then to all vertices
+        """
+        if rows is None:
+            rows = np.arange(len(self.components))
+        if targets is None:
+            targets = self.targets()
+        sources, inverse = np.unique(self.components[rows], return_inverse=True)
+        selector = csr_matrix(
+            (np.ones(len(rows), dtype=bool), (np.arange(len(rows)), inverse)),
+            shape=(len(rows), len(sources)),
+        )
+        expanded = (selector @ self.reach(sources) @ targets).tocsr()
+        expanded.sort_indices()
+        sources, columns = expanded.nonzero()
+        order = np.argsort(rows[sources], kind="stable")
+        return np.column_stack((rows[sources], columns))[order]
+
+    def to_matrix(self) -> csr_matrix:
+        """Returns the expanded closure as a boolean matrix."""
+        return (
+            self.membership @ self.reach(np.arange(len(self.cyclic))) @ self.targets()
+        ).tocsr()
+
+
+def scc_transitive_closure(
+    matrix: Union[Dict[Any, spmatrix], spmatrix]
+) -> CondensedClosure:
+    """
+    Returns the transitive closure of a boolean matrix computed over its condensation:
+    strongly connected components are collapsed, so a component takes a single row of every product,
+    and reachability is propagated along the condensed DAG when the pairs are expanded.
+    :param matrix: boolean matrix or boolean decomposition whose union is closed
+    :return: closure whose pairs are expanded lazily
+    """
+    if isinstance(matrix, dict):
+        if not matrix:
+            empty = csr_matrix((0, 0), dtype=bool)
+            return CondensedClosure(
+                np.empty(0, dtype=np.int64), empty, empty, np.empty(0, dtype=bool)
+            )
+        base = union_of_decomposition(matrix)
+    else:
+        base = csr_matrix(matrix, dtype=bool)
+
+    count_components, components = connected_components(
+        base, directed=True, connection="strong"
+    )
+    rows, columns = base.nonzero()
+    source_components = components[rows]
+    target_components = components[columns]
+
+    cyclic = np.bincount(components, minlength=count_components) > 1
+    cyclic[source_components[rows == columns]] = True
+
+    inner = source_components != target_components
+    dag = csr_matrix(
+        (
+            np.ones(inner.sum(), dtype=bool),
+            (source_components[inner], target_components[inner]),
+        ),
+        shape=(count_components, count_components),
+    )
+    membership = csr_matrix(
+        (
+            np.ones(len(components), dtype=bool),
+            (np.arange(len(components)), components),
+        ),
+        shape=(len(components), count_components),
+    )
+    return CondensedClosure(components, membership, dag, cyclic)
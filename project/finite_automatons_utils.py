@@ -1,4 +1,17 @@
-from typing import Tuple, Dict, Any
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import (
+    Tuple,
+    Dict,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Union,
+)
+import numpy as np
 from pyformlang.regular_expression import Regex
 from pyformlang.finite_automaton import (
     NondeterministicFiniteAutomaton,
@@ -8,19 +21,67 @@ from pyformlang.finite_automaton import (
 )
 import scipy.sparse as sp
 from networkx import MultiDiGraph
-from scipy.sparse import (
-    dok_matrix,
-    block_diag,
-    dok_array,
-    vstack,
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order
+
+from project.bit_matrix import BitMatrix
+from project.boolean_backend import BITSET, CSR, BooleanBackend, get_backend
+from project.closure import (
+    semi_naive_transitive_closure,
+    scc_transitive_closure,
+    union_of_decomposition,
+)
+from project.cache import LRUCache
+from project.graph_cache import get_graph_decomposition
+from project.regex_compiler import (
+    compile_regex_to_matrix_automaton,
+    dfa_from_matrix_automaton,
+)
+from project.sparse_graph import (
+    AnyGraph,
+    LabeledGraph,
+    MatrixAutomaton,
+    VertexIndex,
 )
 
 
+class BfsIteration(NamedTuple):
+    front_nnz: int
+    visited_nnz: int
+
+
+class CompiledRegex(NamedTuple):
+    dfa: DeterministicFiniteAutomaton
+    automaton: MatrixAutomaton
+
+
+regex_cache = LRUCache(max_size=512)
+
+
 def build_dfa_from_regex(expr: str) -> DeterministicFiniteAutomaton:
     """Builds a graph based on the passed regular expression"""
     return Regex(expr).to_epsilon_nfa().minimize()
 
 
+def normalize_regex(expr: str) -> str:
+    """Returns the regular expression with insignificant whitespaces collapsed."""
+    return " ".join(expr.split())
+
+
+def compile_regex(expr: str) -> CompiledRegex:
+    """
+    Returns the minimal DFA by the regular expression together with its boolean decomposition.
+    Results are shared through regex_cache, so they must not be modified.
+    """
+    key = normalize_regex(expr)
+
+    def create():
+        automaton = compile_regex_to_matrix_automaton(key)
+        return CompiledRegex(dfa_from_matrix_automaton(automaton), automaton)
+
+    return regex_cache.get_or_create(key, create)
+
+
 def build_enfa_from_networkx_graph(
     graph: MultiDiGraph, start_nodes: [] = None, end_nodes: [] = None
 ) -> EpsilonNFA:
@@ -51,51 +112,233 @@ def build_enfa_from_networkx_graph(
     return nfa
 
 
-def intersection_automations(first: EpsilonNFA, second: EpsilonNFA) -> EpsilonNFA:
-    """returns the intersection of two finite automata"""
-    (first_indexed_states, first_matrix) = get_states_and_matrix_from_nfa(first)
-    (second_indexed_states, second_matrix) = get_states_and_matrix_from_nfa(second)
+def build_matrix_automaton_from_networkx_graph(
+    graph: AnyGraph, start_nodes: [] = None, end_nodes: [] = None
+) -> MatrixAutomaton:
+    """
+    The function builds boolean matrices for every label directly from the edges of a MultiDiGraph,
+    without an intermediate EpsilonNFA. The matrices are shared through the decomposition cache.
+    The matrices of a LabeledGraph are used as is.
 
-    labels = first_matrix.keys() & second_matrix.keys()
+    Args:
+        graph: graph on which the automaton is built. Must have a "label" field on the edges.
+        start_nodes: if the list is empty, then it is assumed that all vertices are starting.
+        end_nodes: if the list is empty, then it is assumed that all vertices are starting.
+    """
+    decomposition = get_graph_decomposition(graph)
+    states = decomposition.vertices
+    return MatrixAutomaton(
+        states,
+        decomposition.matrices,
+        states.mask(start_nodes),
+        states.mask(end_nodes),
+    )
+
+
+def build_query_automata(
+    graph: AnyGraph, regex: str, start_nodes: [] = None, end_nodes: [] = None
+) -> Tuple[MatrixAutomaton, MatrixAutomaton]:
+    """
+    Returns the graph automaton pruned by prune_matrix_automaton and the DFA of the regex.
+    See build_matrix_automaton_from_networkx_graph for the parameters.
+    """
+    second = compile_regex(regex).automaton
+    first = build_matrix_automaton_from_networkx_graph(graph, start_nodes, end_nodes)
+    return prune_matrix_automaton(first, second), second
 
-    indexed_states = dict()
-    start_states = set()
-    final_states = set()
-    matrix = dict()
 
-    for label in labels:
-        matrix[label] = sp.kron(first_matrix[label], second_matrix[label], format="dok")
+def matrix_automaton_from_nfa(nfa: EpsilonNFA) -> MatrixAutomaton:
+    """Returns the boolean decomposition of a finite automaton with start and final masks."""
+    indexed_states = {state: index for (index, state) in enumerate(nfa.states)}
+    count_states = len(indexed_states)
+
+    transitions = dict()
+    for initial_state, labels_and_states in nfa.to_dict().items():
+        source = indexed_states[initial_state]
+        for label, states in labels_and_states.items():
+            if not isinstance(states, set):
+                states = {states}
+            sources, targets = transitions.setdefault(label, ([], []))
+            for target_state in states:
+                sources.append(source)
+                targets.append(indexed_states[target_state])
+
+    states = VertexIndex(state.value for state in indexed_states.keys())
+    return MatrixAutomaton(
+        states,
+        {
+            label: _build_boolean_matrix(sources, targets, count_states)
+            for label, (sources, targets) in transitions.items()
+        },
+        states.mask(state.value for state in nfa.start_states),
+        states.mask(state.value for state in nfa.final_states),
+    )
 
-    for first_state, first_index in first_indexed_states.items():
-        for second_state, second_index in second_indexed_states.items():
-            new_state_index = first_index * len(second.states) + second_index
-            indexed_states[new_state_index] = new_state_index
 
-            if (
-                first_state in first.start_states
-                and second_state in second.start_states
-            ):
-                start_states.add(new_state_index)
+def _build_boolean_matrix(sources, targets, count_states: int) -> csr_matrix:
+    """Returns a square boolean matrix with the given nonzero coordinates."""
+    return csr_matrix(
+        (np.ones(len(sources), dtype=bool), (sources, targets)),
+        shape=(count_states, count_states),
+    )
 
-            if (
-                first_state in first.final_states
-                and second_state in second.final_states
-            ):
-                final_states.add(new_state_index)
 
-    return build_nfa(matrix, indexed_states, start_states, final_states)
+def intersect_matrix_automata(
+    first: MatrixAutomaton, second: MatrixAutomaton, threads: int = None
+) -> MatrixAutomaton:
+    """
+    Returns the intersection of two automata in the matrix form.
+    Product state first_index * len(second.states) + second_index is numbered by itself.
+    :param threads: if not None, the per-label products are computed in a pool of that many threads
+    """
+    labels = list(first.matrices.keys() & second.matrices.keys())
+    with thread_pool(threads) as executor:
+        products = map_labels(
+            lambda label: sp.kron(
+                first.matrices[label], second.matrices[label], format="csr"
+            ),
+            labels,
+            executor,
+        )
+    matrices = {
+        label: product for label, product in zip(labels, products) if product.nnz
+    }
+
+    return MatrixAutomaton(
+        range(len(first.states) * len(second.states)),
+        matrices,
+        np.outer(first.start_mask, second.start_mask).ravel(),
+        np.outer(first.final_mask, second.final_mask).ravel(),
+    )
+
+
+def prune_matrix_automaton(
+    first: MatrixAutomaton, second: MatrixAutomaton
+) -> MatrixAutomaton:
+    """
+    Restricts the graph first to the edges with labels of the automaton second and to the vertices
+    touching such edges that are reachable from a start vertex and co-reachable from a final one by them.
+    Other vertices lie on no accepted path, so they are dropped and the kept ones are renumbered.
+    Returns first itself if nothing is pruned.
+    """
+    labels = [label for label in first.matrices if label in second.matrices]
+    count = len(first.states)
+    adjacency = boolean_sum([first.matrices[label] for label in labels], (count, count))
+    reverse = adjacency.T.tocsr()
+    touched = (np.diff(adjacency.indptr) > 0) | (np.diff(reverse.indptr) > 0)
+    keep = (
+        touched
+        & _reachable_mask(adjacency, first.start_mask)
+        & _reachable_mask(reverse, first.final_mask)
+    )
+    if keep.all() and len(labels) == len(first.matrices):
+        return first
+
+    indexes = np.flatnonzero(keep)
+    return MatrixAutomaton(
+        VertexIndex(first.states.ids[indexes]),
+        {label: first.matrices[label][indexes][:, indexes] for label in labels},
+        first.start_mask[indexes],
+        first.final_mask[indexes],
+    )
+
+
+def _reachable_mask(adjacency: csr_matrix, sources_mask: np.ndarray) -> np.ndarray:
+    """Marks the vertices reachable from the sources, searching from an extra vertex linked to all of them."""
+    count = adjacency.shape[0]
+    sources = np.flatnonzero(sources_mask)
+    extended = sp.vstack(
+        (
+            sp.hstack((adjacency, csr_matrix((count, 1), dtype=bool))),
+            csr_matrix(
+                (np.ones(len(sources), dtype=bool), (np.zeros_like(sources), sources)),
+                shape=(1, count + 1),
+            ),
+        ),
+        format="csr",
+    )
+    order = breadth_first_order(
+        extended, count, directed=True, return_predecessors=False
+    )
+    reached = np.zeros(count + 1, dtype=bool)
+    reached[order] = True
+    return reached[:count]
+
+
+def thread_pool(threads: int = None):
+    """Returns a context manager with a pool of the given count of threads, with None if threads is None."""
+    return ThreadPoolExecutor(threads) if threads is not None else nullcontext()
+
+
+def map_labels(
+    function: Callable[[Any], Any], items: Iterable[Any], executor: Executor = None
+) -> List[Any]:
+    """Applies the function to every item, dispatching the calls to the executor if it is given."""
+    if executor is None:
+        return [function(item) for item in items]
+    return list(executor.map(function, items))
+
+
+def boolean_sum(
+    matrices: List[Any],
+    shape: Tuple[int, int],
+    executor: Executor = None,
+    backend: BooleanBackend = CSR,
+) -> Any:
+    """Returns the union of boolean matrices, reduced pairwise so the additions of a level run in parallel."""
+    if not matrices:
+        return backend.zeros(shape)
+
+    while len(matrices) > 1:
+        pairs = list(zip(matrices[0::2], matrices[1::2]))
+        matrices = map_labels(
+            lambda pair: backend.add(pair[0], pair[1]), pairs, executor
+        ) + (matrices[2 * len(pairs) :])
+    return matrices[0]
+
+
+def decomposition_density(matrices: Dict[Any, Any]) -> Tuple[int, float]:
+    """Returns the size of the square matrices of a decomposition and the density of their union."""
+    if not matrices:
+        return 0, 0.0
+    size = next(iter(matrices.values())).shape[0]
+    nnz = sum(m.nnz for m in matrices.values())
+    return size, min(nnz / max(size * size, 1), 1.0)
+
+
+def intersection_automations(
+    first: EpsilonNFA, second: EpsilonNFA, threads: int = None
+) -> EpsilonNFA:
+    """returns the intersection of two finite automata, see intersect_matrix_automata for threads"""
+    intersection = matrix_intersection_automations(first, second, threads)
+    return build_nfa(
+        intersection.matrices,
+        intersection.states,
+        np.flatnonzero(intersection.start_mask),
+        np.flatnonzero(intersection.final_mask),
+    )
+
+
+def matrix_intersection_automations(
+    first: EpsilonNFA, second: EpsilonNFA, threads: int = None
+) -> MatrixAutomaton:
+    """returns the intersection of two finite automata in the matrix form"""
+    return intersect_matrix_automata(
+        matrix_automaton_from_nfa(first), matrix_automaton_from_nfa(second), threads
+    )
 
 
 def build_nfa(matrix, indexed_states, start_states, final_states) -> EpsilonNFA:
-    """Builds a finite automaton based on a boolean matrix, indexed states, start and final states."""
+    """
+    Builds a finite automaton based on a boolean matrix, indexed states, start and final states.
+    Only nonzero cells of the matrices are visited, so the matrices are never densified.
+    """
     nfa = EpsilonNFA()
 
-    for label in matrix.keys():
-        arr = matrix[label].toarray()
-        for i in range(len(arr)):
-            for j in range(len(arr)):
-                if arr[i][j]:
-                    nfa.add_transition(indexed_states[i], label, indexed_states[j])
+    for label, label_matrix in matrix.items():
+        rows, columns = label_matrix.nonzero()
+        for i, j in zip(rows, columns):
+            nfa.add_transition(indexed_states[i], label, indexed_states[j])
 
     for start_state in start_states:
         nfa.add_start_state(indexed_states[start_state])
@@ -105,45 +348,56 @@ def build_nfa(matrix, indexed_states, start_states, final_states) -> EpsilonNFA:
     return nfa
 
 
-def get_states_and_matrix_from_nfa(nfa: EpsilonNFA) -> (Dict, Dict[Any, dok_matrix]):
-    """Returns indexed states and a Boolean matrix by a finite automaton."""
-    indexed_states = {state: index for (index, state) in enumerate(nfa.states)}
-    count_states = len(nfa.states)
-
-    matrix = dict()
-    for initial_state, labels_and_states in nfa.to_dict().items():
-        for label, states in labels_and_states.items():
-            if not isinstance(states, set):
-                states = {states}
-            for target_state in states:
-                if label not in matrix:
-                    matrix[label] = dok_matrix((count_states, count_states), dtype=bool)
+def get_states_and_matrix_from_nfa(nfa: EpsilonNFA) -> (Dict, Dict[Any, csr_matrix]):
+    """Returns indexed states and a Boolean matrix by a finite automaton, see matrix_automaton_from_nfa."""
+    automaton = matrix_automaton_from_nfa(nfa)
+    states = list(nfa.states)
+    indexes = automaton.states.indexes([state.value for state in states])
+    return dict(zip(states, indexes.tolist())), automaton.matrices
 
-                matrix[label][
-                    indexed_states[initial_state], indexed_states[target_state]
-                ] = True
 
-    return (indexed_states, matrix)
+CLOSURE_MODES = ("linear", "squaring", "scc", "warshall")
 
 
-def transitive_closure(matrix) -> dok_matrix:
-    """Returns the transitive closure matrix by boolean matrix."""
+def transitive_closure(
+    matrix, mode: str = "linear", backend: Union[str, BooleanBackend] = None
+) -> csr_matrix:
+    """
+    Returns the transitive closure matrix by boolean matrix.
+    :param mode: "linear" or "squaring" for the semi-naive closure,
+        "scc" for the closure over the condensation into strongly connected components,
+        "warshall" for Warshall's algorithm over a BitMatrix
+    :param backend: "csr", "dense", "bitset" or a BooleanBackend the semi-naive rounds are computed with.
+        If None, it is chosen by the size and density of the matrix.
+    """
+    if mode not in CLOSURE_MODES:
+        raise ValueError(f"Unknown closure mode: {mode}")
     if not matrix.values():
-        return dok_matrix((1, 1))
-
-    closure = sum(matrix.values())
-    prev = closure.nnz
-    current = 0
+        return csr_matrix((1, 1), dtype=bool)
+
+    if mode == "scc":
+        return scc_transitive_closure(matrix).to_matrix()
+    if mode == "warshall":
+        return warshall_transitive_closure(matrix).to_csr()
+    backend = get_backend(backend, *decomposition_density(matrix))
+    return backend.to_csr(
+        semi_naive_transitive_closure(matrix, mode == "squaring", backend).matrix
+    )
 
-    while prev != current:
-        closure += closure @ closure
-        prev, current = current, closure.nnz
 
-    return closure
+def warshall_transitive_closure(matrix: Dict[Any, Any]) -> BitMatrix:
+    """Returns the transitive closure of the union of a boolean decomposition as a BitMatrix."""
+    return BitMatrix.from_sparse(union_of_decomposition(matrix)).transitive_closure()
 
 
 def rpq(
-    regex: str, graph: MultiDiGraph, start_states: [] = None, final_states: [] = None
+    regex: str,
+    graph: AnyGraph,
+    start_states: [] = None,
+    final_states: [] = None,
+    closure_mode: str = "linear",
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
 ) -> [Tuple[any, any]]:
     """
     Returns result from Regular Pass Query.
@@ -151,29 +405,133 @@ def rpq(
     :param graph: graph by which the comparison takes place
     :param start_states: if the list is empty, then it is assumed that all vertices are starting.
     :param final_states: if the list is empty, then it is assumed that all vertices are starting.
+    :param closure_mode: "linear", "squaring", "scc" or "warshall", see transitive_closure.
+    :param threads: if not None, the per-label products are computed in a pool of that many threads
+    :param backend: boolean matrix backend of the closure, see transitive_closure.
     :return: pairs of vertices connected by forming a word from the language.
     """
-    first = build_enfa_from_networkx_graph(graph, start_states, final_states)
-    second = build_dfa_from_regex(regex)
+    return pairs_to_set(
+        rpq_pairs(
+            regex, graph, start_states, final_states, closure_mode, threads, backend
+        )
+    )
+
+
+def rpq_pairs(
+    regex: str,
+    graph: AnyGraph,
+    start_states: [] = None,
+    final_states: [] = None,
+    closure_mode: str = "linear",
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> np.ndarray:
+    """
+    Regular Pass Query returning pairs of vertices as an array of shape (k, 2).
+    Pairs are extracted from the closure by selecting its rows and masking its columns, without Python loops.
+    :param closure_mode: "linear", "squaring", "scc" or "warshall", see transitive_closure.
+        With "scc" only pairs between start and final states are ever expanded.
+    :param threads: if not None, the per-label products are computed in a pool of that many threads
+    :param backend: boolean matrix backend of the closure, see transitive_closure.
+    """
+    blocks = list(
+        iter_rpq_pairs(
+            regex,
+            graph,
+            start_states,
+            final_states,
+            closure_mode,
+            threads,
+            backend,
+            chunk_size=max(graph.number_of_nodes(), 1),
+        )
+    )
+    return np.concatenate(blocks or [np.empty((0, 2), dtype=np.int64)])
 
-    intersection = intersection_automations(first, second)
-    (_, matrix) = get_states_and_matrix_from_nfa(intersection)
 
-    closure = transitive_closure(matrix)
-    rows, columns = closure.nonzero()
-    result = set()
-    for start, fin in zip(rows, columns):
-        if start in intersection.start_states and fin in intersection.final_states:
-            result.add((start // len(second.states), fin // len(second.states)))
-    return result
+def iter_rpq_pairs(
+    regex: str,
+    graph: AnyGraph,
+    start_states: [] = None,
+    final_states: [] = None,
+    closure_mode: str = "linear",
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
+    chunk_size: int = 1024,
+) -> Iterator[np.ndarray]:
+    """
+    Regular Pass Query streaming pairs of vertices as arrays of shape (k, 2), block of start vertices by block.
+    Only the closure is kept in memory: the pairs of a block are unique and sorted,
+    and different blocks never share a start vertex.
+    :param chunk_size: count of graph vertices whose pairs form one block
+    See rpq_pairs for the other parameters.
+    """
+    if closure_mode not in CLOSURE_MODES:
+        raise ValueError(f"Unknown closure mode: {closure_mode}")
+
+    first, second = build_query_automata(graph, regex, start_states, final_states)
+
+    intersection = intersect_matrix_automata(first, second, threads)
+    if not intersection.matrices:
+        return
+
+    extract = _closure_pairs(intersection, closure_mode, backend)
+    second_n = len(second.states)
+    for begin in range(0, len(first.states), chunk_size):
+        offset = begin * second_n
+        rows = offset + np.flatnonzero(
+            intersection.start_mask[offset : offset + chunk_size * second_n]
+        )
+        if not len(rows):
+            continue
+
+        pairs = extract(rows)
+        if len(pairs):
+            yield first.states.to_ids(np.unique(pairs // second_n, axis=0))
+
+
+def _closure_pairs(
+    intersection: MatrixAutomaton,
+    closure_mode: str,
+    backend: Union[str, BooleanBackend] = None,
+) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Computes the closure of the product automaton and returns a function that extracts its pairs
+    of shape (k, 2) from the rows with the given sorted indexes to the final states.
+    """
+    final_mask = intersection.final_mask
+    if closure_mode == "scc":
+        closure = scc_transitive_closure(intersection.matrices)
+        targets = closure.targets(final_mask)
+        return lambda rows: closure.pairs(rows, targets)
+
+    if closure_mode == "warshall":
+        backend = BITSET
+        closure = warshall_transitive_closure(intersection.matrices)
+    else:
+        backend = get_backend(backend, *decomposition_density(intersection.matrices))
+        closure = semi_naive_transitive_closure(
+            intersection.matrices, closure_mode == "squaring", backend
+        ).matrix
+    return lambda rows: np.column_stack(
+        backend.select_nonzero(closure, rows, final_mask)
+    )
+
+
+def pairs_to_set(pairs: np.ndarray) -> set:
+    """Converts an array of pairs of shape (k, 2) into a set of tuples."""
+    return set(map(tuple, pairs.tolist()))
 
 
 def bfs_based_rpq_from_graph_and_regex(
-    graph: MultiDiGraph,
+    graph: AnyGraph,
     regex: str,
     separately: bool,
     start_nodes: [] = None,
     end_nodes: [] = None,
+    statistics: List[BfsIteration] = None,
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
 ):
     """
     Reachability check function with regular constraints.
@@ -182,99 +540,377 @@ def bfs_based_rpq_from_graph_and_regex(
     :param separately: is separated output
     :param end_nodes: if the list is empty, then it is assumed that all vertices are starting.
     :param start_nodes: if the list is empty, then it is assumed that all vertices are starting.
+    :param statistics: if not None, statistics of every iteration are appended to it
+    :param threads: if not None, the per-label products are computed in a pool of that many threads
+    :param backend: boolean matrix backend of the front, see bfs_based_rpq_from_matrix_automata
     :return: set of available vertices
     """
-    return bfs_based_rpq(
-        build_enfa_from_networkx_graph(graph, start_nodes, end_nodes),
-        build_dfa_from_regex(regex),
+    return bfs_based_rpq_from_matrix_automata(
+        *build_query_automata(graph, regex, start_nodes, end_nodes),
         separately,
+        statistics,
+        threads,
+        backend,
+    )
+
+
+def iter_bfs_based_rpq_from_graph_and_regex(
+    graph: AnyGraph,
+    regex: str,
+    start_nodes: [] = None,
+    end_nodes: [] = None,
+    memory_budget: int = None,
+    processes: int = None,
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> Iterator[Tuple[Any, List]]:
+    """
+    Reachability check function with regular constraints and separated output, streamed per start vertex.
+    :param graph: graph on which the automaton is built. Must have a "label" field on the edges.
+    :param regex: regular expression by which second graph is constructed
+    :param end_nodes: if the list is empty, then it is assumed that all vertices are starting.
+    :param start_nodes: if the list is empty, then it is assumed that all vertices are starting.
+    :param memory_budget: bytes available to one batch of start vertices
+    :param processes: if not None, batches are distributed over a pool of that many processes
+    :param threads: if not None, the per-label products of a batch are computed in a pool of that many threads
+    :param backend: boolean matrix backend of the front, see bfs_based_rpq_from_matrix_automata
+    :return: pairs (start vertex, sorted list of available vertices)
+    """
+    return iter_bfs_based_rpq_from_matrix_automata(
+        *build_query_automata(graph, regex, start_nodes, end_nodes),
+        memory_budget,
+        processes,
+        threads,
+        backend,
+    )
+
+
+def iter_bfs_based_rpq_pairs_from_graph_and_regex(
+    graph: AnyGraph,
+    regex: str,
+    start_nodes: [] = None,
+    end_nodes: [] = None,
+    memory_budget: int = None,
+    processes: int = None,
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Reachability check function with regular constraints and separated output, streamed as arrays
+    of pairs (start vertex, available vertex) of shape (k, 2). Only one batch of start vertices
+    is kept in memory, see iter_bfs_based_rpq_from_graph_and_regex for the parameters.
+    """
+    return iter_bfs_based_rpq_pairs_from_matrix_automata(
+        *build_query_automata(graph, regex, start_nodes, end_nodes),
+        memory_budget,
+        processes,
+        threads,
+        backend,
     )
 
 
 def bfs_based_rpq(
-    first: NondeterministicFiniteAutomaton,
+    first: Union[NondeterministicFiniteAutomaton, AnyGraph],
     second: NondeterministicFiniteAutomaton,
     separately: bool,
+    statistics: List[BfsIteration] = None,
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
 ):
     """
     Reachability check function with regular constraints.
+    :param first: first graph, an automaton or a graph with all vertices starting and final
+    :param second: second graph
+    :param separately: is separated output
+    :param statistics: if not None, statistics of every iteration are appended to it
+    :param threads: if not None, the per-label products are computed in a pool of that many threads
+    :param backend: boolean matrix backend of the front, see bfs_based_rpq_from_matrix_automata
+    :return: set of available vertices
+    """
+    if isinstance(first, (MultiDiGraph, LabeledGraph)):
+        first = build_matrix_automaton_from_networkx_graph(first)
+    else:
+        first = matrix_automaton_from_nfa(first)
+    return bfs_based_rpq_from_matrix_automata(
+        first,
+        matrix_automaton_from_nfa(second),
+        separately,
+        statistics,
+        threads,
+        backend,
+    )
+
+
+def bfs_based_rpq_from_matrix_automata(
+    first: MatrixAutomaton,
+    second: MatrixAutomaton,
+    separately: bool,
+    statistics: List[BfsIteration] = None,
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
+):
+    """
+    Reachability check function with regular constraints over automata in the matrix form.
+    Every iteration multiplies only the front, i.e. the pairs discovered on the previous iteration.
     :param first: first graph
     :param second: second graph
     :param separately: is separated output
+    :param statistics: if not None, sizes of the front and of the visited pairs
+        are appended to it on every iteration
+    :param threads: if not None, the per-label products are computed in a pool of that many threads
+    :param backend: "csr", "dense", "bitset" or a BooleanBackend the front is stored in.
+        If None, it is chosen by the size of the front and the density of the first graph.
     :return: set of available vertices
     """
-    (first_indexed_states, first_matrix) = get_states_and_matrix_from_nfa(first)
-    (second_indexed_states, second_matrix) = get_states_and_matrix_from_nfa(second)
-    first_start_state_indexes = {node.value for node in first.start_states}
-    first_final_state_indexes = {node.value for node in first.final_states}
-    second_start_state_indexes = {node.value for node in second.start_states}
-    second_final_state_indexes = {node.value for node in second.final_states}
-    first_n = len(first.states)
+    start_indexes = np.flatnonzero(first.start_mask)
+    with thread_pool(threads) as executor:
+        pairs = _bfs_accepted_pairs(
+            first, second, start_indexes, separately, statistics, executor, backend
+        )
+
+    if not separately:
+        return set(first.states.to_ids(np.unique(pairs[:, 1])).tolist())
+
+    pairs[:, 0] = start_indexes[pairs[:, 0]]
+    answer = {}
+    for start, fin in first.states.to_ids(pairs).tolist():
+        answer.setdefault(start, []).append(fin)
+    for key, value in answer.items():
+        answer[key] = sorted(value)
+    return answer
+
+
+def _bfs_accepted_pairs(
+    first: MatrixAutomaton,
+    second: MatrixAutomaton,
+    start_indexes: np.ndarray,
+    separately: bool,
+    statistics: List[BfsIteration] = None,
+    executor: Executor = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> np.ndarray:
+    """
+    Runs the multi-source BFS from the given start vertices.
+    Returns unique pairs (block, reached vertex index) of shape (k, 2), where the block
+    is the position of the start vertex in start_indexes if separately, otherwise 0.
+    """
     second_n = len(second.states)
+    rows, columns = _bfs_visited(
+        first, second, start_indexes, separately, statistics, executor, backend
+    )
+    accepted = second.final_mask[rows % second_n] & first.final_mask[columns]
+    return np.unique(
+        np.column_stack((rows[accepted] // second_n, columns[accepted])), axis=0
+    )
 
-    def transform_rows(front_part: dok_array):
-        front_part_out = dok_array(front_part.shape, dtype=bool)
-        xi, yj = front_part.nonzero()
-        for i, j in zip(xi, yj):
-            if j < second_n:
-                row_second_part = front_part[[i], second_n:]
-                if row_second_part.nnz > 0:
-                    shift = i - i % second_n
-                    front_part_out[shift + j, j] = True
-                    front_part_out[[shift + j], second_n:] += row_second_part
-        return front_part_out
-
-    def get_front(start_states=None):
-        front_out = dok_matrix((second_n, first_n + second_n), dtype=bool)
-
-        front_first = dok_matrix((1, first_n), dtype=bool)
-        for i in start_states:
-            front_first[0, i] = True
-        for ss in second_start_state_indexes:
-            i = second_indexed_states[ss]
-            front_out[i, i] = True
-            front_out[[i], second_n:] = front_first
-        return front_out
-
-    direct_sum = {
-        label: block_diag((second_matrix[label], first_matrix[label]))
-        for label in (first_matrix.keys() & second_matrix.keys())
-    }
 
-    front = (
-        vstack([get_front({i}) for i in first_start_state_indexes])
-        if separately
-        else get_front(first_start_state_indexes)
+def bfs_step(
+    first: MatrixAutomaton,
+    second: MatrixAutomaton,
+    count_blocks: int = 1,
+    executor: Executor = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> Tuple[BooleanBackend, Callable[[Any], Any]]:
+    """
+    Returns the backend of the front of the multi-source BFS and the function moving the front along one edge.
+    Row block * len(second.states) + q of the front holds the vertices reached in the state q of the second automaton.
+    If the executor is given, the per-label products are dispatched to it.
+    :param backend: see bfs_based_rpq_from_matrix_automata
+    """
+    second_n = len(second.states)
+    size, density = decomposition_density(first.matrices)
+    backend = get_backend(backend, max(size, count_blocks * second_n), density)
+
+    # Moving the rows to the states reached by a label is a multiplication
+    # by the transposed transition matrix of the second automaton.
+    # The move matrices are block diagonal and stay in CSR whatever the backend of the front.
+    blocks = sp.identity(count_blocks, dtype=bool, format="csr")
+    steps = map_labels(
+        lambda label: (
+            sp.kron(blocks, second.matrices[label].T, format="csr"),
+            backend.from_sparse(first.matrices[label]),
+        ),
+        list(first.matrices.keys() & second.matrices.keys()),
+        executor,
     )
 
-    def update_visited(vst, func):
-        vst_nnz = vst.nnz
-        for _, matrix in direct_sum.items():
-            front_part = func(matrix)
-            vst += transform_rows(front_part)
-        return vst, vst_nnz != vst.nnz
-
-    visited = dok_array(front.shape, dtype=bool)
-    (visited, check) = update_visited(visited, lambda m: front @ m)
-    if check:
-        while check:
-            (visited, check) = update_visited(visited, lambda m: visited @ m)
-
-    answer = set()
-    second_states = list(second_indexed_states.keys())
-    first_states = list(first_indexed_states.keys())
-    rows, columns = visited.nonzero()
-    for i, j in zip(rows, columns):
-        if j >= second_n and second_states[i % second_n] in second_final_state_indexes:
-            state_index = j - second_n
-            if first_states[state_index] in first_final_state_indexes:
-                answer.add((i // second_n, state_index) if separately else state_index)
-
-    copy = answer
+    def step(front):
+        products = map_labels(
+            lambda move: backend.multiply_sparse(
+                move[0], backend.multiply(front, move[1])
+            ),
+            steps,
+            executor,
+        )
+        return boolean_sum(products, backend.shape(front), executor, backend)
+
+    return backend, step
+
+
+def _bfs_visited(
+    first: MatrixAutomaton,
+    second: MatrixAutomaton,
+    start_indexes: np.ndarray,
+    separately: bool,
+    statistics: List[BfsIteration] = None,
+    executor: Executor = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs the multi-source BFS and returns the visited cells (block * len(second.states) + state, vertex index).
+    If the executor is given, the per-label products of every step are dispatched to it.
+    """
+    second_start_state_indexes = np.flatnonzero(second.start_mask)
+    first_n = len(first.states)
+    second_n = len(second.states)
+    count_blocks = len(start_indexes) if separately else 1
+    backend, step = bfs_step(first, second, count_blocks, executor, backend)
+
     if separately:
-        answer = {}
-        for i in copy:
-            answer.setdefault(i[0], []).append(i[1])
-        for key, value in answer.items():
-            answer[key] = sorted(value)
-    return answer
+        rows = (
+            np.arange(count_blocks)[:, None] * second_n + second_start_state_indexes
+        ).ravel()
+        columns = np.repeat(start_indexes, len(second_start_state_indexes))
+    else:
+        rows = np.repeat(second_start_state_indexes, len(start_indexes))
+        columns = np.tile(start_indexes, len(second_start_state_indexes))
+    shape = (count_blocks * second_n, first_n)
+    front = backend.from_coo(rows, columns, shape)
+
+    visited = backend.zeros(shape)
+    while backend.nnz(front):
+        front = backend.difference(step(front), visited)
+        visited = backend.add(visited, front)
+        if statistics is not None:
+            statistics.append(BfsIteration(backend.nnz(front), backend.nnz(visited)))
+
+    return backend.nonzero(visited)
+
+
+BFS_BYTES_PER_CELL = 20
+BFS_BYTES_PER_MOVE = 16
+
+
+def bfs_batch_size(
+    first: MatrixAutomaton, second: MatrixAutomaton, memory_budget: int = None
+) -> int:
+    """
+    Returns how many start vertices can be searched separately at once within the memory budget in bytes.
+    The estimate is pessimistic: every block of the front and of the visited matrix may become dense.
+    Every block also adds a copy of the transitions of the second automaton to the CSR move matrices.
+    """
+    count_starts = max(int(first.start_mask.sum()), 1)
+    if memory_budget is None:
+        return count_starts
+
+    count_moves = sum(m.nnz for m in second.matrices.values()) + len(
+        second.matrices
+    ) * len(second.states)
+    bytes_per_source = (
+        BFS_BYTES_PER_CELL * len(first.states) * len(second.states)
+        + BFS_BYTES_PER_MOVE * count_moves
+    )
+    return min(max(memory_budget // max(bytes_per_source, 1), 1), count_starts)
+
+
+def iter_bfs_based_rpq_from_matrix_automata(
+    first: MatrixAutomaton,
+    second: MatrixAutomaton,
+    memory_budget: int = None,
+    processes: int = None,
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> Iterator[Tuple[Any, List]]:
+    """
+    Reachability check function with regular constraints and separated output,
+    executed in batches of start vertices.
+    :param first: first graph
+    :param second: second graph
+    :param memory_budget: bytes available to one batch, see bfs_batch_size. If None, a single batch is used.
+    :param processes: if not None, batches are distributed over a pool of that many processes
+    :param threads: if not None, the per-label products of a batch are computed in a pool of that many threads
+    :param backend: boolean matrix backend of the front, see bfs_based_rpq_from_matrix_automata
+    :return: pairs (start vertex, sorted list of available vertices) for every start vertex,
+        yielded as soon as the batch of the start vertex is completed
+    """
+    for batch, pairs in _iter_bfs_batches(
+        first, second, memory_budget, processes, threads, backend
+    ):
+        bounds = np.searchsorted(pairs[:, 0], np.arange(len(batch) + 1))
+        reached = first.states.to_ids(pairs[:, 1]).tolist()
+        for block, start in enumerate(first.states.to_ids(batch).tolist()):
+            yield start, sorted(reached[bounds[block] : bounds[block + 1]])
+
+
+def iter_bfs_based_rpq_pairs_from_matrix_automata(
+    first: MatrixAutomaton,
+    second: MatrixAutomaton,
+    memory_budget: int = None,
+    processes: int = None,
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Reachability check function with regular constraints and separated output, streamed as arrays
+    of pairs (start vertex, available vertex) of shape (k, 2), one array per batch of start vertices.
+    Parameters are the same as in iter_bfs_based_rpq_from_matrix_automata.
+    """
+    for batch, pairs in _iter_bfs_batches(
+        first, second, memory_budget, processes, threads, backend
+    ):
+        if len(pairs):
+            pairs[:, 0] = batch[pairs[:, 0]]
+            yield first.states.to_ids(pairs)
+
+
+def _iter_bfs_batches(
+    first: MatrixAutomaton,
+    second: MatrixAutomaton,
+    memory_budget: int = None,
+    processes: int = None,
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yields batches of start vertex indexes together with their accepted pairs, see _bfs_accepted_pairs."""
+    start_indexes = np.flatnonzero(first.start_mask)
+    batch_size = bfs_batch_size(first, second, memory_budget)
+    batches = [
+        start_indexes[i : i + batch_size]
+        for i in range(0, len(start_indexes), batch_size)
+    ]
+
+    if processes is None:
+        with thread_pool(threads) as executor:
+            for batch in batches:
+                yield batch, _bfs_accepted_pairs(
+                    first, second, batch, True, executor=executor, backend=backend
+                )
+        return
+
+    with ProcessPoolExecutor(
+        processes,
+        initializer=_init_bfs_worker,
+        initargs=(first, second, threads, backend),
+    ) as executor:
+        yield from zip(batches, executor.map(_bfs_worker_batch, batches))
+
+
+_bfs_worker_automata = None
+
+
+def _init_bfs_worker(
+    first: MatrixAutomaton,
+    second: MatrixAutomaton,
+    threads: int = None,
+    backend: Union[str, BooleanBackend] = None,
+) -> None:
+    global _bfs_worker_automata
+    _bfs_worker_automata = (first, second, threads, backend)
+
+
+def _bfs_worker_batch(start_indexes: np.ndarray) -> np.ndarray:
+    first, second, threads, backend = _bfs_worker_automata
+    with thread_pool(threads) as executor:
+        return _bfs_accepted_pairs(
+            first, second, start_indexes, True, executor=executor, backend=backend
+        )
@@ -0,0 +1,123 @@
+import weakref
+from typing import Hashable, Tuple, Union
+
+from networkx import MultiDiGraph
+
+from project.cache import CacheInfo, LRUCache
+from project.sparse_graph import LabeledGraph
+
+VERSION_ATTRIBUTE = "decomposition_version"
+
+
+def decompose_graph(graph: MultiDiGraph) -> LabeledGraph:
+    """Builds boolean matrices for every label directly from the edges of a MultiDiGraph."""
+    return LabeledGraph.from_networkx(graph)
+
+
+def graph_fingerprint(graph: MultiDiGraph) -> Tuple:
+    """
+    Cheap fingerprint of a graph tracking its changes: counts of vertices and edges and the mutation counter
+    stored in graph.graph[VERSION_ATTRIBUTE]. Changes that keep both counts (e.g. relabeling an edge)
+    must be followed by mark_graph_changed.
+    """
+    return (
+        graph.number_of_nodes(),
+        graph.number_of_edges(),
+        graph.graph.get(VERSION_ATTRIBUTE, 0),
+    )
+
+
+def is_tracking_changes(graph: MultiDiGraph) -> bool:
+    """Returns whether the graph opted in to the decomposition cache by track_graph_changes."""
+    return VERSION_ATTRIBUTE in graph.graph
+
+
+def track_graph_changes(graph: MultiDiGraph) -> None:
+    """
+    Opts the graph in to the decomposition cache. The owner of the graph promises to call mark_graph_changed
+    after every change, since the cache can't notice the changes that keep the counts of vertices and edges.
+    """
+    graph.graph.setdefault(VERSION_ATTRIBUTE, 0)
+
+
+def mark_graph_changed(graph: MultiDiGraph) -> None:
+    """Increments the mutation counter of the graph, so its cached decomposition is rebuilt."""
+    graph.graph[VERSION_ATTRIBUTE] = graph.graph.get(VERSION_ATTRIBUTE, 0) + 1
+
+
+class DecompositionCache:
+    """
+    Cache of graph decompositions keyed by the graph identity and its fingerprint.
+    Only the graphs tracking their changes (see track_graph_changes) are cached,
+    other graphs are decomposed on every request, so plain networkx edits never make a result stale.
+    An entry is dropped when its graph is garbage collected, explicitly invalidated
+    or evicted as the least recently used one over the limits.
+    Cached decompositions are shared, so they must not be modified.
+    :param max_graphs: maximal count of cached graphs
+    :param max_bytes: maximal total size of the cached matrices in bytes
+    """
+
+    def __init__(self, max_graphs: int = 32, max_bytes: int = 1 << 28):
+        self._entries = LRUCache(
+            max_size=max_graphs,
+            max_weight=max_bytes,
+            weigh=lambda entry: entry[1].nbytes,
+        )
+        self._finalizers = dict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, graph: MultiDiGraph) -> LabeledGraph:
+        """Returns the decomposition of the graph, building it if it is absent, outdated or not cached."""
+        if not is_tracking_changes(graph):
+            self._misses += 1
+            return decompose_graph(graph)
+
+        key = self._key(graph)
+        fingerprint = graph_fingerprint(graph)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            self._hits += 1
+            return entry[1]
+
+        self._misses += 1
+        decomposition = decompose_graph(graph)
+        self._entries.put(key, (fingerprint, decomposition))
+        return decomposition
+
+    def invalidate(self, graph: MultiDiGraph) -> None:
+        """Drops the cached decomposition of the graph."""
+        self._entries.invalidate(id(graph))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._hits = 0
+        self._misses = 0
+
+    def info(self) -> CacheInfo:
+        """Returns the counters, an outdated entry counts as a miss."""
+        return self._entries.info()._replace(hits=self._hits, misses=self._misses)
+
+    def __contains__(self, graph: MultiDiGraph) -> bool:
+        return id(graph) in self._entries
+
+    def _key(self, graph: MultiDiGraph) -> Hashable:
+        """Returns the identity of the graph, dropping the entry once the graph is collected."""
+        key = id(graph)
+        if key not in self._finalizers:
+            self._finalizers[key] = weakref.finalize(graph, self._forget, key)
+        return key
+
+    def _forget(self, key: Hashable) -> None:
+        self._finalizers.pop(key, None)
+        self._entries.invalidate(key)
+
+
+decomposition_cache = DecompositionCache()
+
+
+def get_graph_decomposition(graph: Union[MultiDiGraph, LabeledGraph]) -> LabeledGraph:
+    """Returns the decomposition of the graph through the shared decomposition_cache, a LabeledGraph is returned as is."""
+    if isinstance(graph, LabeledGraph):
+        return graph
+    return decomposition_cache.get(graph)
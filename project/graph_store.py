@@ -0,0 +1,145 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import List
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import Epsilon
+from scipy.sparse import csr_matrix
+
+from project.graph_cache import decompose_graph
+from project.sparse_graph import LabeledGraph, VertexIndex
+
+STORE_FORMAT_VERSION = 2
+STORE_ROOT_VARIABLE = "GRAPH_STORE_ROOT"
+DEFAULT_STORE_ROOT = os.path.join(
+    os.path.expanduser("~"), ".cache", "formal-lang-course", "graphs"
+)
+METADATA_FILE = "metadata.json"
+VERTICES_FILE = "vertices.npy"
+
+
+def store_root(root: str = None) -> str:
+    """Returns the root directory of the store: the given one, the GRAPH_STORE_ROOT variable or the default."""
+    if root is not None:
+        return root
+    return os.environ.get(STORE_ROOT_VARIABLE, DEFAULT_STORE_ROOT)
+
+
+def stored_graph_path(name: str, root: str = None) -> str:
+    """Returns the directory of the graph in the current store format version."""
+    return os.path.join(store_root(root), name, f"v{STORE_FORMAT_VERSION}")
+
+
+def has_stored_graph(name: str, root: str = None) -> bool:
+    return os.path.isfile(os.path.join(stored_graph_path(name, root), METADATA_FILE))
+
+
+def store_graph(graph: MultiDiGraph, name: str, root: str = None) -> str:
+    """
+    Writes the boolean decomposition of the graph to the store and returns its directory.
+    Every label gets the indptr, indices and data arrays of its CSR matrix, vertex ids are kept in one more array.
+    Labels must be strings, integers or None, vertex ids must be integers or strings.
+    The directory is replaced atomically, so a reader never sees a partially written graph.
+    """
+    return store_decomposition(decompose_graph(graph), name, root)
+
+
+def store_decomposition(
+    decomposition: LabeledGraph, name: str, root: str = None
+) -> str:
+    """Writes the decomposition to the store, see store_graph."""
+    vertices = decomposition.vertices.ids
+    if vertices.dtype == object:
+        if not all(isinstance(v, str) for v in vertices):
+            raise ValueError("Vertex ids must be integers or strings")
+        vertices = vertices.astype(str)
+
+    labels = []
+    for label in decomposition.matrices:
+        label = None if label == Epsilon() else label
+        if label is not None and not isinstance(label, (str, int)):
+            raise ValueError(f"Label {label!r} can't be stored")
+        labels.append(label)
+
+    path = stored_graph_path(name, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = tempfile.mkdtemp(prefix=".import-", dir=os.path.dirname(path))
+    try:
+        np.save(os.path.join(temporary, VERTICES_FILE), vertices)
+        for code, matrix in enumerate(decomposition.matrices.values()):
+            np.save(os.path.join(temporary, f"{code}.indptr.npy"), matrix.indptr)
+            np.save(os.path.join(temporary, f"{code}.indices.npy"), matrix.indices)
+            np.save(
+                os.path.join(temporary, f"{code}.data.npy"),
+                np.ones(matrix.nnz, dtype=bool),
+            )
+        metadata = {
+            "version": STORE_FORMAT_VERSION,
+            "count_vertices": len(vertices),
+            "count_edges": int(sum(m.nnz for m in decomposition.matrices.values())),
+            "labels": labels,
+        }
+        with open(os.path.join(temporary, METADATA_FILE), "w") as file:
+            json.dump(metadata, file)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temporary, path)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+    return path
+
+
+def load_stored_graph(name: str, root: str = None, mmap: bool = True) -> LabeledGraph:
+    """
+    Loads the stored graph without building a networkx graph.
+    With mmap all arrays are memory-mapped and, for integer vertex ids, nothing is scanned or allocated
+    per vertex or edge, so loading takes time independent of the graph size and the pages are read only
+    when an engine touches them. Vertex ids are indexed on the first lookup, string ids are read at once. Edges are counted once per vertex pair and label,
+    as in the decomposition.
+    """
+    path = stored_graph_path(name, root)
+    metadata = read_stored_metadata(name, root)
+
+    mode = "r" if mmap else None
+    ids = np.load(os.path.join(path, VERTICES_FILE), mmap_mode=mode)
+    if ids.dtype.kind == "U":
+        ids = ids.tolist()
+    count = metadata["count_vertices"]
+
+    matrices = dict()
+    for code, label in enumerate(metadata["labels"]):
+        indptr = np.load(os.path.join(path, f"{code}.indptr.npy"), mmap_mode=mode)
+        indices = np.load(os.path.join(path, f"{code}.indices.npy"), mmap_mode=mode)
+        data = np.load(os.path.join(path, f"{code}.data.npy"), mmap_mode=mode)
+        matrices[Epsilon() if label is None else label] = csr_matrix(
+            (data, indices, indptr),
+            shape=(count, count),
+            copy=False,
+        )
+    return LabeledGraph(VertexIndex(ids), matrices)
+
+
+def read_stored_metadata(name: str, root: str = None) -> dict:
+    """Returns the metadata of the stored graph: version, count_vertices, count_edges and labels."""
+    path = os.path.join(stored_graph_path(name, root), METADATA_FILE)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Graph {name} is not in the store {store_root(root)}")
+    with open(path) as file:
+        metadata = json.load(file)
+    if metadata.get("version") != STORE_FORMAT_VERSION:
+        raise ValueError(
+            f"Graph {name} is stored in the format version {metadata.get('version')}"
+        )
+    return metadata
+
+
+def stored_graph_names(root: str = None) -> List[str]:
+    """Returns the names of the graphs stored in the current format version."""
+    root = store_root(root)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if has_stored_graph(name, root))
@@ -1,25 +1,176 @@
+import gzip
+from collections import Counter
 import cfpq_data
-from networkx.drawing import nx_pydot
+import numpy as np
+import pandas as pd
 from networkx import MultiDiGraph
-from typing import List, NamedTuple, Tuple
+from pyformlang.finite_automaton import Epsilon
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Tuple, Union
+
+from project import graph_store
+from project.graph_writer import write_dot
+from project.sparse_graph import AnyGraph, LabeledGraph, VertexIndex
+
+EDGE_LIST_CHUNK_ROWS = 1 << 20
+CFPQ_DATA_SEPARATOR = " "
+
+
+class SccSummary(NamedTuple):
+    count: int
+    largest: int
+    count_singletons: int
 
 
 class GraphInfo(NamedTuple):
     count_vertices: int
     count_edges: int
     labels: List[str]
+    label_counts: Dict[Any, int] = None
+    out_degree_histogram: Dict[int, int] = None
+    in_degree_histogram: Dict[int, int] = None
+    scc: SccSummary = None
+
+
+def get_graph_info(graph: Union[str, AnyGraph], statistics: bool = False) -> GraphInfo:
+    """
+    Returns tuple of the form: (number of vertices, number of edges, List[str] - labels)
+    for the graph or the graph of cfpq_data with the given name. Labels of labeled edges are sorted
+    by the number of uses, as in cfpq_data. A named graph is read from its edge file in chunks,
+    without building a MultiDiGraph.
+    :param statistics: if True, the edge counts of the labels, the histograms {degree: count of vertices}
+        of out- and in-degrees and the summary of strongly connected components are filled too
+    """
+    if isinstance(graph, str):
+        return get_edge_list_info(
+            cfpq_data.download(graph), statistics, CFPQ_DATA_SEPARATOR
+        )
+    if isinstance(graph, LabeledGraph):
+        return _labeled_graph_info(graph, statistics)
+
+    edges = list(graph.edges(data="label"))
+    vertices = VertexIndex(graph.nodes)
+    return _edges_info(
+        len(vertices),
+        Counter(label for _, _, label in edges if label is not None),
+        vertices.indexes([v for v, _, _ in edges]),
+        vertices.indexes([u for _, u, _ in edges]),
+        statistics,
+    )
+
+
+def get_edge_list_info(
+    path: str, statistics: bool = False, separator: str = None
+) -> GraphInfo:
+    """
+    Returns the info of the graph in the edge list file, see get_graph_info and read_edge_list.
+    The file is read once in chunks, the labels are counted and the vertex ids are interned chunk by chunk.
+    The vertex codes of the edges are kept until the end only for the statistics.
+    :param separator: column separator, see read_edge_list
+    """
+    label_codes, vertex_codes = dict(), dict()
+    label_counts = np.zeros(0, dtype=np.int64)
+    sources, targets = [], []
+    for chunk_sources, chunk_targets, codes in _iter_edge_chunks(
+        path, separator, EDGE_LIST_CHUNK_ROWS, label_codes, vertex_codes
+    ):
+        counts = np.bincount(codes, minlength=len(label_codes))
+        counts[: len(label_counts)] += label_counts
+        label_counts = counts
+        if statistics:
+            sources.append(chunk_sources)
+            targets.append(chunk_targets)
+
+    labeled_counts = {
+        label: int(label_counts[code])
+        for label, code in label_codes.items()
+        if label != Epsilon()
+    }
+    if not statistics:
+        return GraphInfo(
+            len(vertex_codes), int(label_counts.sum()), _sorted_labels(labeled_counts)
+        )
+    return _edges_info(
+        len(vertex_codes),
+        labeled_counts,
+        np.concatenate(sources or [np.empty(0, dtype=np.int64)]),
+        np.concatenate(targets or [np.empty(0, dtype=np.int64)]),
+        statistics,
+    )
+
 
+def _edges_info(
+    count_vertices: int,
+    label_counts: Dict[Any, int],
+    sources: np.ndarray,
+    targets: np.ndarray,
+    statistics: bool,
+) -> GraphInfo:
+    """Returns the info of the graph with edges given by arrays of vertex indexes, parallel edges are counted."""
+    info = GraphInfo(count_vertices, len(sources), _sorted_labels(label_counts))
+    if not statistics:
+        return info
 
-def get_graph_info(name: str) -> GraphInfo:
-    """Returns tuple of the form: (number of vertices, number of edges, List[str] - labels)"""
-    graph = load_graph(name)
-    return GraphInfo(
-        graph.number_of_nodes(),
-        graph.number_of_edges(),
-        cfpq_data.get_sorted_labels(graph),
+    adjacency = csr_matrix(
+        (np.ones(len(sources), dtype=bool), (sources, targets)),
+        shape=(count_vertices, count_vertices),
+    )
+    return info._replace(
+        label_counts=dict(label_counts),
+        out_degree_histogram=_histogram(np.bincount(sources, minlength=count_vertices)),
+        in_degree_histogram=_histogram(np.bincount(targets, minlength=count_vertices)),
+        scc=_scc_summary(adjacency),
     )
 
 
+def _labeled_graph_info(graph: LabeledGraph, statistics: bool) -> GraphInfo:
+    """Returns the info of the LabeledGraph computed from its CSR arrays, label by label."""
+    label_counts = {
+        label: matrix.nnz
+        for label, matrix in graph.matrices.items()
+        if label != Epsilon()
+    }
+    count = graph.number_of_nodes()
+    info = GraphInfo(count, graph.number_of_edges(), _sorted_labels(label_counts))
+    if not statistics:
+        return info
+
+    out_degrees = np.zeros(count, dtype=np.int64)
+    in_degrees = np.zeros(count, dtype=np.int64)
+    adjacency = csr_matrix((count, count), dtype=bool)
+    for matrix in graph.matrices.values():
+        out_degrees += np.diff(matrix.indptr)
+        in_degrees += np.bincount(matrix.indices, minlength=count)
+        adjacency = adjacency + matrix
+    return info._replace(
+        label_counts=label_counts,
+        out_degree_histogram=_histogram(out_degrees),
+        in_degree_histogram=_histogram(in_degrees),
+        scc=_scc_summary(adjacency),
+    )
+
+
+def _sorted_labels(label_counts: Dict[Any, int]) -> List[Any]:
+    return [
+        label for label, _ in sorted(label_counts.items(), key=lambda x: (-x[1], x[0]))
+    ]
+
+
+def _histogram(degrees: np.ndarray) -> Dict[int, int]:
+    """Returns {degree: count of vertices with it} for the degrees that occur."""
+    counts = np.bincount(degrees)
+    return {degree: int(counts[degree]) for degree in np.flatnonzero(counts).tolist()}
+
+
+def _scc_summary(adjacency: csr_matrix) -> SccSummary:
+    count, components = connected_components(
+        adjacency, directed=True, connection="strong"
+    )
+    sizes = np.bincount(components, minlength=count)
+    return SccSummary(count, int(sizes.max()) if count else 0, int(np.sum(sizes == 1)))
+
+
 def create_labeled_graph_with_two_cycle_and_save_to_file(
     count_nodes_in_first_cycle: int,
     count_nodes_in_second_cycle: int,
@@ -33,10 +184,9 @@ def create_labeled_graph_with_two_cycle_and_save_to_file(
     save_graph_to_file(graph, path_file)
 
 
-def save_graph_to_file(graph: MultiDiGraph, path_file: str) -> None:
-    """Saves the MultiDiGraph by the passed relative path"""
-    nx_graph = nx_pydot.to_pydot(graph)
-    nx_graph.write(path_file)
+def save_graph_to_file(graph: AnyGraph, path_file: str) -> None:
+    """Saves the graph in the DOT format by the passed relative path, streaming it line by line"""
+    write_dot(graph, path_file)
 
 
 def create_labeled_graph_with_two_cycle(
@@ -54,3 +204,118 @@ def load_graph(name: str) -> MultiDiGraph:
     """Loads the graph by name"""
     graph_path = cfpq_data.download(name)
     return cfpq_data.graph_from_csv(graph_path)
+
+
+def load_graph_decomposition(name: str, store_root: str = None) -> LabeledGraph:
+    """Loads the memory-mapped graph from the local graph store, importing it from cfpq_data on the first use"""
+    if not graph_store.has_stored_graph(name, store_root):
+        graph_store.store_decomposition(
+            read_edge_list(cfpq_data.download(name), CFPQ_DATA_SEPARATOR),
+            name,
+            store_root,
+        )
+    return graph_store.load_stored_graph(name, store_root)
+
+
+def read_edge_list(
+    path: str, separator: str = None, chunk_rows: int = EDGE_LIST_CHUNK_ROWS
+) -> LabeledGraph:
+    """
+    Reads an edge list "from to label" into a LabeledGraph without building a MultiDiGraph.
+    The file is parsed in chunks of chunk_rows lines into NumPy arrays, labels and vertex ids are interned
+    into integer codes chunk by chunk. Lines without a label are epsilon edges. Vertex ids are read as strings
+    and converted to integers once at the end if all of them are integers, so they don't depend on chunk_rows.
+    :param path: CSV or TSV file, optionally gzipped (".gz")
+    :param separator: column separator, detected from the first line if None: a tab, a comma or a space
+    """
+    sources, targets, codes = [], [], []
+    label_codes, vertex_codes = dict(), dict()
+    for chunk_sources, chunk_targets, chunk_codes in _iter_edge_chunks(
+        path, separator, chunk_rows, label_codes, vertex_codes
+    ):
+        sources.append(chunk_sources)
+        targets.append(chunk_targets)
+        codes.append(chunk_codes)
+
+    if not codes:
+        return LabeledGraph.from_edges(
+            VertexIndex([]), *(np.empty(0, dtype=np.int64),) * 3, []
+        )
+
+    return LabeledGraph.from_edges(
+        VertexIndex(_vertex_ids(vertex_codes)),
+        np.concatenate(sources),
+        np.concatenate(targets),
+        np.concatenate(codes),
+        list(label_codes.keys()),
+    )
+
+
+def _iter_edge_chunks(
+    path: str,
+    separator: str,
+    chunk_rows: int,
+    label_codes: Dict[Any, int],
+    vertex_codes: Dict[str, int],
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yields chunks (source codes, target codes, label codes) of the edge list,
+    interning new vertex ids into vertex_codes and new labels into label_codes.
+    Vertex ids are interned as strings, missing labels as Epsilon().
+    """
+    if separator is None:
+        separator = _detect_separator(path)
+
+    for chunk in pd.read_csv(
+        path,
+        sep=separator,
+        header=None,
+        names=["from", "to", "label"],
+        engine="c",
+        compression="infer",
+        chunksize=chunk_rows,
+        dtype={"from": str, "to": str, "label": "category"},
+    ):
+        chunk_codes = chunk["label"].cat.codes.to_numpy()
+        chunk_labels = list(chunk["label"].cat.categories)
+        if (chunk_codes < 0).any():
+            # Missing labels have the code -1, i.e. the last label of the chunk.
+            chunk_labels.append(Epsilon())
+        codes = _intern(chunk_labels, label_codes)[chunk_codes]
+
+        local, ids = pd.factorize(
+            np.concatenate((chunk["from"].to_numpy(), chunk["to"].to_numpy()))
+        )
+        vertices = _intern(ids, vertex_codes)[local]
+        yield vertices[: len(chunk)], vertices[len(chunk) :], codes
+
+
+def _intern(values: Iterable[Any], codes: Dict[Any, int]) -> np.ndarray:
+    """Returns the codes of the values, assigning the next free codes to new ones."""
+    return np.fromiter(
+        (codes.setdefault(value, len(codes)) for value in values),
+        dtype=np.int64,
+        count=len(values),
+    )
+
+
+def _vertex_ids(vertex_codes: Dict[str, int]) -> np.ndarray:
+    """Returns the vertex ids ordered by code, as integers if every id is written as an integer."""
+    ids = np.array(list(vertex_codes), dtype=object)
+    try:
+        integers = ids.astype(np.int64)
+    except (ValueError, OverflowError):
+        return ids
+    if (integers.astype(str).astype(object) == ids).all():
+        return integers
+    return ids
+
+
+def _detect_separator(path: str) -> str:
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt") as file:
+        line = file.readline()
+    for separator in ("\t", ","):
+        if separator in line:
+            return separator
+    return " "
@@ -0,0 +1,131 @@
+import re
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, TextIO, Union
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import Epsilon
+
+from project.sparse_graph import AnyGraph, LabeledGraph
+
+WRITE_CHUNK_LINES = 1 << 16
+
+# Identifiers pydot leaves unquoted: ASCII names and unsigned numbers.
+_DOT_IDENTIFIER = re.compile(r"[a-zA-Z_][a-zA-Z_0-9]*|[0-9]+\.?[0-9]*|[0-9]*\.[0-9]+")
+_DOT_ESCAPES = {ord('"'): '\\"', ord("\n"): "\\n", ord("\r"): "\\r"}
+_DOT_KEYWORDS = {"node", "edge", "graph", "digraph", "subgraph", "strict"}
+
+
+def write_dot(graph: AnyGraph, path: str) -> None:
+    """
+    Writes the graph in the DOT format line by line, in buffered chunks, without building an object model.
+    The layout is the one of pydot: vertices, then edges "v -> u  [key=0, label=a];".
+    Edges of a LabeledGraph have no key, its epsilon edges have no label.
+    """
+    with open(path, "w") as file:
+        _write_lines(file, _dot_lines(graph))
+
+
+def write_edge_list(graph: AnyGraph, path: str, separator: str = " ") -> None:
+    """
+    Writes the edges as lines "v u label" readable by read_edge_list and cfpq_data.graph_from_csv.
+    Edges without a label are written as "v u".
+    """
+    with open(path, "w") as file:
+        _write_lines(file, _edge_list_lines(graph, separator))
+
+
+def dot_id(value: Any) -> str:
+    """
+    Returns the value as a DOT identifier quoted by the rules of pydot: everything except ASCII names
+    and unsigned numbers is quoted, e.g. negative numbers, non-ASCII text and keywords.
+    """
+    text = str(value)
+    if _DOT_IDENTIFIER.fullmatch(text) and text.lower() not in _DOT_KEYWORDS:
+        return text
+    return '"' + text.translate(_DOT_ESCAPES) + '"'
+
+
+def _write_lines(file: TextIO, lines: Iterable[str]) -> None:
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= WRITE_CHUNK_LINES:
+            file.write("\n".join(chunk) + "\n")
+            chunk.clear()
+    if chunk:
+        file.write("\n".join(chunk) + "\n")
+
+
+def _dot_lines(graph: AnyGraph) -> Iterator[str]:
+    if isinstance(graph, LabeledGraph):
+        yield "digraph  {"
+        ids = [dot_id(v) for v in graph.vertices]
+        yield from (f"{v};" for v in ids)
+        for label, rows, columns in _labeled_edges(graph):
+            attributes = "" if label is None else f"  [label={dot_id(label)}]"
+            yield from (
+                f"{ids[v]} -> {ids[u]}{attributes};"
+                for v, u in zip(rows.tolist(), columns.tolist())
+            )
+        yield "}"
+        return
+
+    name = graph.graph.get("name")
+    yield f"digraph {'' if name is None else dot_id(name)} {{"
+    ids = dict()
+    for node, data in graph.nodes(data=True):
+        ids[node] = dot_id(node)
+        attributes = _dot_attributes(data)
+        yield f"{ids[node]} {attributes};" if attributes else f"{ids[node]};"
+    if graph.is_multigraph():
+        edges = graph.edges(keys=True, data=True)
+    else:
+        edges = ((v, u, None, data) for v, u, data in graph.edges(data=True))
+    for v, u, key, data in edges:
+        if key is not None:
+            data = {"key": key, **data}
+        attributes = _dot_attributes(data)
+        edge = f"{ids[v]} -> {ids[u]}"
+        yield f"{edge}  {attributes};" if attributes else f"{edge};"
+    yield "}"
+
+
+def _dot_attributes(data: dict) -> str:
+    attributes = ", ".join(
+        f"{_cached_dot_id(name)}="
+        + (_cached_dot_id(value) if isinstance(value, (str, int)) else dot_id(value))
+        for name, value in data.items()
+        if value is not None
+    )
+    return f"[{attributes}]" if attributes else ""
+
+
+@lru_cache(maxsize=1 << 12)
+def _cached_dot_id(value: Union[str, int]) -> str:
+    """dot_id of attribute names and values, which mostly repeat from edge to edge."""
+    return dot_id(value)
+
+
+def _edge_list_lines(graph: AnyGraph, separator: str) -> Iterator[str]:
+    if isinstance(graph, MultiDiGraph):
+        for v, u, label in graph.edges(data="label"):
+            fields = (v, u) if label is None else (v, u, label)
+            yield separator.join(map(str, fields))
+        return
+
+    ids = np.asarray(list(map(str, graph.vertices)), dtype=object)
+    for label, rows, columns in _labeled_edges(graph):
+        suffix = "" if label is None else separator + str(label)
+        yield from (
+            f"{v}{separator}{u}{suffix}"
+            for v, u in zip(ids[rows].tolist(), ids[columns].tolist())
+        )
+
+
+def _labeled_edges(graph: LabeledGraph) -> Iterator:
+    """Yields (label, source indexes, target indexes) per label, None for epsilon edges."""
+    eps = Epsilon()
+    for label, matrix in graph.matrices.items():
+        rows, columns = matrix.nonzero()
+        yield None if label == eps else label, rows, columns
@@ -0,0 +1,212 @@
+from collections import Counter
+from typing import Any, Iterable, Set, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import Epsilon
+from scipy.sparse import csr_matrix
+
+from project.closure import boolean_difference, semi_naive_transitive_closure
+from project.finite_automatons_utils import compile_regex, pairs_to_set
+from project.graph_cache import mark_graph_changed
+from project.sparse_graph import VertexIndex
+
+Edge = Tuple[Any, Any, Any]
+
+RECOMPUTE_FRACTION = 0.5
+
+
+class MaterializedRpq:
+    """
+    Answer of a Regular Path Query kept up to date under batches of edge insertions and deletions.
+    The transitive closure of the product of the graph and the query DFA is materialized:
+    insertions propagate only the paths through the new product edges (delta closure),
+    deletions recompute only the rows of the product states that reach a removed product edge.
+    Product state v * len(dfa states) + q is numbered by the vertex index v and the DFA state q,
+    new vertices are appended, so indexes of known vertices never change.
+    The graph is updated together with the closure and marked as changed for the decomposition cache.
+    :param graph: graph with a "label" field on the edges
+    :param regex: regular expression of the query
+    :param start_nodes: if None, then all vertices, including the added ones, are starting
+    :param final_nodes: if None, then all vertices, including the added ones, are final
+    """
+
+    def __init__(
+        self,
+        graph: MultiDiGraph,
+        regex: str,
+        start_nodes: Iterable[Any] = None,
+        final_nodes: Iterable[Any] = None,
+    ):
+        self.graph = graph
+        self.regex = regex
+        self.start_nodes = None if start_nodes is None else set(start_nodes)
+        self.final_nodes = None if final_nodes is None else set(final_nodes)
+
+        self._dfa = compile_regex(regex).automaton
+        self._ids = list(graph.nodes)
+        self._indexes = {node: index for index, node in enumerate(self._ids)}
+        self._edges = Counter(
+            (v, _edge_label(label), u) for v, u, label in graph.edges(data="label")
+        )
+
+        self._base = self._product_edges(self._edges.items())
+        self._closure = semi_naive_transitive_closure(self._base > 0).matrix
+        self._pairs = None
+
+    @property
+    def count_states(self) -> int:
+        return len(self._ids) * len(self._dfa.states)
+
+    @property
+    def pairs(self) -> np.ndarray:
+        """Current answer as an array of pairs of vertices of shape (k, 2), recomputed only after changes."""
+        if self._pairs is None:
+            self._pairs = self._extract_pairs()
+        return self._pairs
+
+    def answer(self) -> Set[Tuple]:
+        """Current answer as a set of pairs of vertices, the same as rpq returns."""
+        return pairs_to_set(self.pairs)
+
+    def add_edge(self, v: Any, label: Any, u: Any) -> None:
+        self.add_edges([(v, label, u)])
+
+    def remove_edge(self, v: Any, label: Any, u: Any) -> None:
+        self.remove_edges([(v, label, u)])
+
+    def add_edges(self, edges: Iterable[Edge]) -> None:
+        """Inserts a batch of edges (v, label, u) and propagates the paths through them."""
+        edges = Counter((v, _edge_label(label), u) for v, label, u in edges)
+        for v, label, u in edges.elements():
+            self.graph.add_edge(v, u, label=_graph_label(label))
+        mark_graph_changed(self.graph)
+        self._add_vertices(node for v, _, u in edges for node in (v, u))
+        self._edges.update(edges)
+
+        contribution = self._product_edges(edges.items())
+        new_edges = boolean_difference(contribution > 0, self._base > 0)
+        self._base = self._base + contribution
+        if new_edges.nnz:
+            self._propagate(new_edges)
+            self._pairs = None
+
+    def remove_edges(self, edges: Iterable[Edge]) -> None:
+        """Deletes a batch of edges (v, label, u), every edge must be present in the graph."""
+        edges = Counter((v, _edge_label(label), u) for v, label, u in edges)
+        for edge, count in edges.items():
+            if self._edges[edge] < count:
+                raise ValueError(f"Edge {edge} is not in the graph")
+        for v, label, u in edges.elements():
+            self.graph.remove_edge(v, u, key=self._edge_key(v, label, u))
+        mark_graph_changed(self.graph)
+        self._edges.subtract(edges)
+        self._edges += Counter()
+
+        contribution = self._product_edges(edges.items())
+        self._base = self._base - contribution
+        self._base.eliminate_zeros()
+        removed = boolean_difference(contribution > 0, self._base > 0)
+        if removed.nnz:
+            self._recompute_rows(np.unique(removed.nonzero()[0]))
+            self._pairs = None
+
+    def _propagate(self, new_edges: csr_matrix) -> None:
+        """
+        Adds to the closure the paths through the new product edges: every round joins the pairs
+        reaching an edge with the pairs reachable from it, until no path through several new edges is missing.
+        """
+        identity = sp.identity(self.count_states, dtype=bool, format="csr")
+        closure = self._closure
+        while True:
+            reach = closure + identity
+            delta = boolean_difference(reach @ new_edges @ reach, closure)
+            if not delta.nnz:
+                break
+            closure = closure + delta
+        self._closure = closure
+
+    def _recompute_rows(self, sources: np.ndarray) -> None:
+        """
+        Recomputes the closure rows of the product states that reach one of the given states by the old closure.
+        When most of the states are affected, the whole closure is recomputed instead.
+        """
+        affected = np.zeros(self.count_states, dtype=bool)
+        affected[sources] = True
+        affected[np.unique(self._closure[:, sources].nonzero()[0])] = True
+        rows = np.flatnonzero(affected)
+
+        base = (self._base > 0).tocsr()
+        if len(rows) > RECOMPUTE_FRACTION * self.count_states:
+            self._closure = semi_naive_transitive_closure(base).matrix
+            return
+
+        reached = base[rows]
+        delta = reached
+        while delta.nnz:
+            delta = boolean_difference(delta @ base, reached)
+            reached = reached + delta
+
+        placement = csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, np.arange(len(rows)))),
+            shape=(self.count_states, len(rows)),
+        )
+        kept = sp.diags(~affected, dtype=bool, format="csr") @ self._closure
+        self._closure = (kept + placement @ reached).tocsr()
+
+    def _product_edges(self, edges: Iterable[Tuple[Edge, int]]) -> csr_matrix:
+        """Returns the product edges of graph edges with multiplicities as a matrix of counts."""
+        count_dfa_states = len(self._dfa.states)
+        rows, columns, counts = [], [], []
+        for (v, label, u), count in edges:
+            transitions = self._dfa.matrices.get(label)
+            if transitions is None or count <= 0:
+                continue
+            sources, targets = transitions.nonzero()
+            rows.append(self._indexes[v] * count_dfa_states + sources)
+            columns.append(self._indexes[u] * count_dfa_states + targets)
+            counts.append(np.full(len(sources), count, dtype=np.int64))
+
+        if not rows:
+            return csr_matrix((self.count_states, self.count_states), dtype=np.int64)
+        return csr_matrix(
+            (np.concatenate(counts), (np.concatenate(rows), np.concatenate(columns))),
+            shape=(self.count_states, self.count_states),
+        )
+
+    def _add_vertices(self, nodes: Iterable[Any]) -> None:
+        for node in nodes:
+            if node not in self._indexes:
+                self._indexes[node] = len(self._ids)
+                self._ids.append(node)
+
+        shape = (self.count_states, self.count_states)
+        if self._closure.shape != shape:
+            self._base.resize(shape)
+            self._closure.resize(shape)
+
+    def _edge_key(self, v: Any, label: Any, u: Any) -> Any:
+        for key, data in self.graph.get_edge_data(v, u, default={}).items():
+            if _edge_label(data.get("label")) == label:
+                return key
+        raise ValueError(f"Edge {(v, label, u)} is not in the graph")
+
+    def _extract_pairs(self) -> np.ndarray:
+        vertices = VertexIndex(self._ids)
+        start_mask = np.outer(vertices.mask(self.start_nodes), self._dfa.start_mask)
+        final_mask = np.outer(vertices.mask(self.final_nodes), self._dfa.final_mask)
+
+        rows_indexes = np.flatnonzero(start_mask.ravel())
+        rows, columns = self._closure[rows_indexes].nonzero()
+        selected = final_mask.ravel()[columns]
+        pairs = np.column_stack((rows_indexes[rows[selected]], columns[selected]))
+        return vertices.to_ids(np.unique(pairs // len(self._dfa.states), axis=0))
+
+
+def _edge_label(label: Any) -> Any:
+    return Epsilon() if label is None else label
+
+
+def _graph_label(label: Any) -> Any:
+    return None if label == Epsilon() else label
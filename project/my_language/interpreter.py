@@ -72,7 +72,7 @@ def get_graph_from_value(value: BaseValue) -> GraphValue:
     check_types(value, [GraphValue, RegexValue])
 
     if isinstance(value, RegexValue):
-        return create_graph_value_from_enfa(fa.build_dfa_from_regex(str(value.value)))
+        return create_graph_value_from_enfa(fa.compile_regex(str(value.value)).dfa)
     else:
         return value
 
@@ -0,0 +1,274 @@
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from pyformlang.finite_automaton import DeterministicFiniteAutomaton, State, Symbol
+from pyformlang.regular_expression import Regex
+from pyformlang.regular_expression.regex_objects import (
+    Concatenation,
+    Empty,
+    Epsilon,
+    KleeneStar,
+    Symbol as RegexSymbol,
+    Union,
+)
+from scipy.sparse import csr_matrix
+
+from project.sparse_graph import MatrixAutomaton, VertexIndex
+
+
+def compile_regex_to_matrix_automaton(expr: str) -> MatrixAutomaton:
+    """
+    Builds the minimal DFA by the regular expression directly in the matrix form:
+    Glushkov position automaton, subset construction and Hopcroft minimization.
+    """
+    return minimize_dfa(determinize(glushkov_automaton(Regex(expr))))
+
+
+def dfa_from_matrix_automaton(dfa: MatrixAutomaton) -> DeterministicFiniteAutomaton:
+    """Converts a deterministic automaton in the matrix form into the pyformlang DFA."""
+    result = DeterministicFiniteAutomaton()
+    for label, matrix in dfa.matrices.items():
+        rows, columns = matrix.nonzero()
+        for i, j in zip(rows.tolist(), columns.tolist()):
+            result.add_transition(
+                State(dfa.states[i]), Symbol(label), State(dfa.states[j])
+            )
+
+    for index in np.flatnonzero(dfa.start_mask):
+        result.add_start_state(State(dfa.states[index]))
+    for index in np.flatnonzero(dfa.final_mask):
+        result.add_final_state(State(dfa.states[index]))
+    return result
+
+
+def glushkov_automaton(regex: Regex) -> MatrixAutomaton:
+    """
+    Builds the epsilon-free Glushkov position automaton by the parsed regular expression.
+    State 0 is the start state, state p is the p-th occurrence of a symbol in the expression.
+    """
+    labels = []
+    follow = []
+    results = []
+    stack = [(regex, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((son, False) for son in reversed(node.sons))
+            continue
+
+        # Every result is a triple (nullable, first positions, last positions).
+        head = node.head
+        if isinstance(head, Epsilon):
+            results.append((True, [], []))
+        elif isinstance(head, Empty):
+            results.append((False, [], []))
+        elif isinstance(head, RegexSymbol):
+            labels.append(head.value)
+            results.append((False, [len(labels)], [len(labels)]))
+        elif isinstance(head, KleeneStar):
+            _, first, last = results.pop()
+            follow.append((last, first))
+            results.append((True, first, last))
+        elif isinstance(head, Union):
+            right, left = results.pop(), results.pop()
+            results.append(
+                (left[0] or right[0], left[1] + right[1], left[2] + right[2])
+            )
+        elif isinstance(head, Concatenation):
+            right, left = results.pop(), results.pop()
+            follow.append((left[2], right[1]))
+            results.append(
+                (
+                    left[0] and right[0],
+                    left[1] + right[1] if left[0] else left[1],
+                    right[2] + left[2] if right[0] else right[2],
+                )
+            )
+        else:
+            raise ValueError(f"Unsupported regular expression node: {head}")
+
+    nullable, first, last = results.pop()
+    follow.append(([0], first))
+
+    sources = np.concatenate([np.repeat(s, len(t)) for s, t in follow] or [[]]).astype(
+        np.int64
+    )
+    targets = np.concatenate([np.tile(t, len(s)) for s, t in follow] or [[]]).astype(
+        np.int64
+    )
+
+    count_states = len(labels) + 1
+    final_mask = np.zeros(count_states, dtype=bool)
+    final_mask[last] = True
+    final_mask[0] = nullable
+    start_mask = np.zeros(count_states, dtype=bool)
+    start_mask[0] = True
+
+    target_labels = np.array([None] + labels, dtype=object)[targets]
+    return MatrixAutomaton(
+        VertexIndex(range(count_states)),
+        _build_matrices(sources, targets, target_labels, count_states),
+        start_mask,
+        final_mask,
+    )
+
+
+def determinize(nfa: MatrixAutomaton) -> MatrixAutomaton:
+    """Builds the DFA reachable from the start states of the epsilon-free automaton by subset construction."""
+    labels = list(nfa.matrices.keys())
+    matrices = [nfa.matrices[label].tocsr() for label in labels]
+
+    start = tuple(np.flatnonzero(nfa.start_mask).tolist())
+    subsets = [start]
+    indexed_subsets = {start: 0}
+    transitions = []
+    index = 0
+    while index < len(subsets):
+        subset = np.array(subsets[index], dtype=np.int64)
+        for label, matrix in zip(labels, matrices):
+            targets = tuple(np.unique(matrix[subset].indices).tolist())
+            if not targets:
+                continue
+            target_index = indexed_subsets.setdefault(targets, len(subsets))
+            if target_index == len(subsets):
+                subsets.append(targets)
+            transitions.append((index, target_index, label))
+        index += 1
+
+    count_states = len(subsets)
+    final_mask = np.array(
+        [nfa.final_mask[list(subset)].any() for subset in subsets], dtype=bool
+    )
+    start_mask = np.zeros(count_states, dtype=bool)
+    start_mask[0] = True
+    return MatrixAutomaton(
+        VertexIndex(range(count_states)),
+        _build_matrices_from_transitions(transitions, count_states),
+        start_mask,
+        final_mask,
+    )
+
+
+def minimize_dfa(dfa: MatrixAutomaton) -> MatrixAutomaton:
+    """
+    Returns the minimal DFA by Hopcroft partition refinement over transition arrays.
+    The dead state is removed, so the result may be incomplete.
+    """
+    count_states = len(dfa.states)
+    sink = count_states
+    labels = list(dfa.matrices.keys())
+
+    delta = np.full((len(labels), count_states + 1), sink, dtype=np.int64)
+    for label_index, label in enumerate(labels):
+        rows, columns = dfa.matrices[label].nonzero()
+        delta[label_index, rows] = columns
+    inverse = [
+        csr_matrix(
+            (
+                np.ones(count_states + 1, dtype=bool),
+                (delta[label_index], np.arange(count_states + 1)),
+            ),
+            shape=(count_states + 1, count_states + 1),
+        )
+        for label_index in range(len(labels))
+    ]
+
+    final = np.append(dfa.final_mask, False)
+    blocks = [b for b in (np.flatnonzero(~final), np.flatnonzero(final)) if len(b)]
+    block_of = np.zeros(count_states + 1, dtype=np.int64)
+    for block_index, block in enumerate(blocks):
+        block_of[block] = block_index
+
+    worklist = set(range(len(blocks)))
+    in_splitter = np.zeros(count_states + 1, dtype=bool)
+    while worklist:
+        splitter = blocks[worklist.pop()]
+        for predecessors in inverse:
+            sources = np.unique(predecessors[splitter].indices)
+            if not len(sources):
+                continue
+            in_splitter[sources] = True
+            for block_index in np.unique(block_of[sources]).tolist():
+                block = blocks[block_index]
+                inside = in_splitter[block]
+                if inside.all():
+                    continue
+
+                new_index = len(blocks)
+                blocks[block_index] = block[inside]
+                blocks.append(block[~inside])
+                block_of[blocks[new_index]] = new_index
+                if block_index in worklist or len(blocks[new_index]) <= len(
+                    blocks[block_index]
+                ):
+                    worklist.add(new_index)
+                else:
+                    worklist.add(block_index)
+            in_splitter[sources] = False
+
+    start = int(np.flatnonzero(dfa.start_mask)[0]) if dfa.start_mask.any() else sink
+    dead = block_of[sink]
+    if block_of[start] == dead:
+        alive = [dead]
+    else:
+        alive = [block_of[start]] + [
+            b for b in range(len(blocks)) if b != dead and b != block_of[start]
+        ]
+    renumbered = np.full(len(blocks), -1, dtype=np.int64)
+    renumbered[alive] = np.arange(len(alive))
+
+    representatives = np.array([blocks[b][0] for b in alive], dtype=np.int64)
+    transitions = []
+    for label_index, label in enumerate(labels):
+        targets = block_of[delta[label_index, representatives]]
+        live = targets != dead
+        transitions.extend(
+            (source, target, label)
+            for source, target in zip(
+                np.flatnonzero(live).tolist(), renumbered[targets[live]].tolist()
+            )
+        )
+
+    count_alive = len(alive)
+    start_mask = np.zeros(count_alive, dtype=bool)
+    start_mask[0] = True
+    return MatrixAutomaton(
+        VertexIndex(range(count_alive)),
+        _build_matrices_from_transitions(transitions, count_alive),
+        start_mask,
+        final[representatives],
+    )
+
+
+def _build_matrices_from_transitions(
+    transitions: List[Tuple[int, int, Any]], count_states: int
+) -> Dict[Any, csr_matrix]:
+    """Returns boolean matrices by triples (source, target, label)."""
+    if not transitions:
+        return dict()
+
+    sources, targets, labels = zip(*transitions)
+    return _build_matrices(
+        np.array(sources, dtype=np.int64),
+        np.array(targets, dtype=np.int64),
+        np.array(labels, dtype=object),
+        count_states,
+    )
+
+
+def _build_matrices(
+    sources: np.ndarray, targets: np.ndarray, labels: np.ndarray, count_states: int
+) -> Dict[Any, csr_matrix]:
+    """Returns boolean matrices grouped by labels of the transitions."""
+    matrices = dict()
+    for label in dict.fromkeys(labels.tolist()):
+        selected = labels == label
+        matrices[label] = csr_matrix(
+            (
+                np.ones(int(selected.sum()), dtype=bool),
+                (sources[selected], targets[selected]),
+            ),
+            shape=(count_states, count_states),
+        )
+    return matrices
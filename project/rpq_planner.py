@@ -0,0 +1,310 @@
+from typing import Any, Dict, List, NamedTuple, Union
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csr_matrix
+
+from project.boolean_backend import BooleanBackend
+from project.finite_automatons_utils import (
+    bfs_based_rpq_from_matrix_automata,
+    bfs_step,
+    build_query_automata,
+)
+from project.sparse_graph import AnyGraph, LabeledGraph, MatrixAutomaton
+
+DIRECTIONS = ("forward", "backward", "bidirectional")
+PLAN_COST_RATIO = 4
+BIDIRECTIONAL_MIN_COST = 1024
+# Fixed cost of a round of the bidirectional search, in cells of a front.
+BIDIRECTIONAL_ROUND_CELLS = 4096
+
+
+class RpqPlan(NamedTuple):
+    """
+    Strategy chosen for a BFS-based RPQ and the estimates it was chosen by.
+    The cost of a direction is the count of its source vertices plus the count of graph edges
+    incident to them with a label the query automaton can read first.
+    """
+
+    direction: str
+    count_starts: int
+    count_finals: int
+    forward_cost: int
+    backward_cost: int
+
+
+def reverse_matrix_automaton(
+    automaton: MatrixAutomaton, reverse_matrices: Dict[Any, csr_matrix] = None
+) -> MatrixAutomaton:
+    """
+    Returns the automaton accepting the reversed words: transposed matrices, swapped start and final states.
+    :param reverse_matrices: transposed matrices of the automaton if they are at hand,
+        e.g. LabeledGraph.reverse_matrices, otherwise they are computed
+    """
+    if reverse_matrices is None:
+        reverse_matrices = {
+            label: m.T.tocsr() for label, m in automaton.matrices.items()
+        }
+    return MatrixAutomaton(
+        automaton.states,
+        {label: reverse_matrices[label] for label in automaton.matrices},
+        automaton.final_mask,
+        automaton.start_mask,
+    )
+
+
+def restrict_vertices(automaton: MatrixAutomaton, mask: np.ndarray) -> MatrixAutomaton:
+    """Returns the automaton without transitions touching the vertices outside of the mask, indexes are kept."""
+    keep = sp.diags(mask, dtype=bool, format="csr")
+    return MatrixAutomaton(
+        automaton.states,
+        {label: (keep @ m @ keep).tocsr() for label, m in automaton.matrices.items()},
+        automaton.start_mask & mask,
+        automaton.final_mask & mask,
+    )
+
+
+def plan_rpq(
+    first: MatrixAutomaton, second: MatrixAutomaton, direction: str = None
+) -> RpqPlan:
+    """
+    Chooses the search direction for the graph first and the query automaton second.
+    Backward search is chosen when it is PLAN_COST_RATIO times cheaper than forward search and vice versa,
+    for comparable costs of at least BIDIRECTIONAL_MIN_COST both searches are alternated.
+    The costs are estimated from the rows and the columns of the matrices, nothing is transposed.
+    :param direction: if not None, the plan uses this direction
+    """
+    if direction is not None and direction not in DIRECTIONS:
+        raise ValueError(f"Unknown search direction: {direction}")
+
+    forward_cost = _search_cost(first, second, backward=False)
+    backward_cost = _search_cost(first, second, backward=True)
+    if direction is None:
+        if backward_cost * PLAN_COST_RATIO <= forward_cost:
+            direction = "backward"
+        elif forward_cost * PLAN_COST_RATIO <= backward_cost:
+            direction = "forward"
+        elif min(forward_cost, backward_cost) >= BIDIRECTIONAL_MIN_COST:
+            direction = "bidirectional"
+        else:
+            direction = "forward"
+
+    return RpqPlan(
+        direction,
+        int(first.start_mask.sum()),
+        int(first.final_mask.sum()),
+        forward_cost,
+        backward_cost,
+    )
+
+
+def execute_rpq_plan(
+    plan: RpqPlan,
+    first: MatrixAutomaton,
+    second: MatrixAutomaton,
+    separately: bool,
+    backend: Union[str, BooleanBackend] = None,
+    reverse_matrices: Dict[Any, csr_matrix] = None,
+):
+    """
+    Runs the BFS-based RPQ in the direction of the plan.
+    The result is the same as of bfs_based_rpq_from_matrix_automata.
+    The bidirectional search alternates the forward search from the start vertices and the backward one
+    from the final vertices, see BidirectionalSearch.
+    :param reverse_matrices: transposed matrices of first, see reverse_matrix_automaton
+    """
+    if plan.direction == "forward":
+        return bfs_based_rpq_from_matrix_automata(
+            first, second, separately, backend=backend
+        )
+
+    reversed_first = reverse_matrix_automaton(first, reverse_matrices)
+    if plan.direction == "bidirectional":
+        search = BidirectionalSearch(first, second, reversed_first, backend)
+        if not separately:
+            accepted = search.accepted_vertices()
+            return set(first.states.to_ids(np.flatnonzero(accepted)).tolist())
+        vertices = search.path_vertices()
+        if not vertices.all():
+            first = restrict_vertices(first, vertices)
+        return bfs_based_rpq_from_matrix_automata(first, second, True, backend=backend)
+
+    reached_from = bfs_based_rpq_from_matrix_automata(
+        reversed_first, reverse_matrix_automaton(second), True, backend=backend
+    )
+    if not separately:
+        return set(reached_from.keys())
+
+    answer = {}
+    for final, starts in reached_from.items():
+        for start in starts:
+            answer.setdefault(start, []).append(final)
+    return {start: sorted(finals) for start, finals in answer.items()}
+
+
+class BidirectionalSearch:
+    """
+    Forward search from the pairs (start state, start vertex) and backward search from the accepting pairs
+    (final state, final vertex) over the product of the graph and the query automaton, run in turns:
+    every round expands the search that has done less work, counting the cells of its fronts
+    and BIDIRECTIONAL_ROUND_CELLS per round. The searches meet when one of them is complete.
+    A complete forward search holds the answer, a complete backward search marks the co-reachable pairs,
+    the only ones the rest of the forward search has to expand.
+    """
+
+    __slots__ = (
+        "first",
+        "second",
+        "backend",
+        "forward",
+        "visited",
+        "coreachable",
+        "_forward_step",
+    )
+
+    def __init__(
+        self,
+        first: MatrixAutomaton,
+        second: MatrixAutomaton,
+        reversed_first: MatrixAutomaton,
+        backend: Union[str, BooleanBackend] = None,
+    ):
+        self.first = first
+        self.second = second
+        self.backend, self._forward_step = bfs_step(first, second, backend=backend)
+        self.forward = self._pairs(second.start_mask, first.start_mask)
+        self.visited = self.backend.zeros(self._shape)
+        self.coreachable = self._pairs(second.final_mask, first.final_mask)
+        self._meet(reversed_first)
+
+    def _meet(self, reversed_first: MatrixAutomaton) -> None:
+        """Runs the searches in turns until one of them is complete."""
+        backend = self.backend
+        _, backward_step = bfs_step(
+            reversed_first, reverse_matrix_automaton(self.second), backend=backend
+        )
+        backward = self.coreachable
+        forward_work, backward_work = 0, 0
+        while backend.nnz(self.forward) and backend.nnz(backward):
+            if forward_work + backend.nnz(self.forward) <= backward_work + backend.nnz(
+                backward
+            ):
+                forward_work += backend.nnz(self.forward) + BIDIRECTIONAL_ROUND_CELLS
+                self.forward = backend.difference(
+                    self._forward_step(self.forward), self.visited
+                )
+                self.visited = backend.add(self.visited, self.forward)
+            else:
+                backward_work += backend.nnz(backward) + BIDIRECTIONAL_ROUND_CELLS
+                backward = backend.difference(backward_step(backward), self.coreachable)
+                self.coreachable = backend.add(self.coreachable, backward)
+
+    @property
+    def _shape(self):
+        return len(self.second.states), len(self.first.states)
+
+    @property
+    def forward_complete(self) -> bool:
+        return not self.backend.nnz(self.forward)
+
+    def accepted_vertices(self) -> np.ndarray:
+        """
+        Marks the final vertices reachable from the start ones by a non-empty accepted path,
+        completing the forward search through the co-reachable pairs only.
+        """
+        backend = self.backend
+        front = self._coreachable_part(self.forward)
+        while backend.nnz(front):
+            front = self._coreachable_part(
+                backend.difference(self._forward_step(front), self.visited)
+            )
+            self.visited = backend.add(self.visited, front)
+        self.forward = front
+
+        _, columns = backend.select_nonzero(
+            self.visited, np.flatnonzero(self.second.final_mask), self.first.final_mask
+        )
+        return self._vertices(columns)
+
+    def path_vertices(self) -> np.ndarray:
+        """
+        Marks a superset of the vertices of accepted paths: the vertices of the complete search,
+        with the start vertices if it is the forward one.
+        """
+        if self.forward_complete:
+            _, columns = self.backend.nonzero(self.visited)
+            return self._vertices(columns) | self.first.start_mask
+        _, columns = self.backend.nonzero(self.coreachable)
+        return self._vertices(columns)
+
+    def _pairs(self, states_mask: np.ndarray, vertices_mask: np.ndarray):
+        states = np.flatnonzero(states_mask)
+        vertices = np.flatnonzero(vertices_mask)
+        return self.backend.from_coo(
+            np.repeat(states, len(vertices)),
+            np.tile(vertices, len(states)),
+            self._shape,
+        )
+
+    def _coreachable_part(self, front):
+        """Pairs of the front that lead to an accepting pair, known once the backward search is complete."""
+        return self.backend.difference(
+            front, self.backend.difference(front, self.coreachable)
+        )
+
+    def _vertices(self, columns: np.ndarray) -> np.ndarray:
+        mask = np.zeros(len(self.first.states), dtype=bool)
+        mask[columns] = True
+        return mask
+
+
+def planned_bfs_based_rpq_from_graph_and_regex(
+    graph: AnyGraph,
+    regex: str,
+    separately: bool,
+    start_nodes: [] = None,
+    end_nodes: [] = None,
+    direction: str = None,
+    plans: List[RpqPlan] = None,
+    backend: Union[str, BooleanBackend] = None,
+):
+    """
+    Reachability check function with regular constraints searching in the direction chosen by plan_rpq.
+    The transposed matrices of a LabeledGraph that is not pruned are taken from its reverse_matrices.
+    :param direction: if not None, the search goes in this direction
+    :param plans: if not None, the chosen plan is appended to it
+    See bfs_based_rpq_from_graph_and_regex for the other parameters and the result.
+    """
+    first, second = build_query_automata(graph, regex, start_nodes, end_nodes)
+    plan = plan_rpq(first, second, direction)
+    if plans is not None:
+        plans.append(plan)
+
+    reverse_matrices = None
+    if isinstance(graph, LabeledGraph) and first.matrices is graph.matrices:
+        reverse_matrices = graph.reverse_matrices
+    return execute_rpq_plan(plan, first, second, separately, backend, reverse_matrices)
+
+
+def _search_cost(
+    first: MatrixAutomaton, second: MatrixAutomaton, backward: bool
+) -> int:
+    """
+    Count of the source vertices and of the edges incident to them that can be read in a source state:
+    the start ones for the forward search, the final ones for the backward search.
+    """
+    sources = first.final_mask if backward else first.start_mask
+    states = second.final_mask if backward else second.start_mask
+    fanout = sum(
+        _incident_count(first.matrices[label], sources, backward)
+        for label in first.matrices.keys() & second.matrices.keys()
+        if _incident_count(second.matrices[label], states, backward)
+    )
+    return int(sources.sum()) + fanout
+
+
+def _incident_count(matrix: csr_matrix, mask: np.ndarray, columns: bool) -> int:
+    """Count of the set cells in the rows, or in the columns, marked in the mask."""
+    if columns:
+        return int(np.count_nonzero(mask[matrix.indices]))
+    return int(np.diff(matrix.indptr)[mask].sum())
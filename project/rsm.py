@@ -1,9 +1,9 @@
-from typing import NamedTuple, Dict, Any
+from typing import NamedTuple, Dict, Any, Union
 from pyformlang.finite_automaton import EpsilonNFA
 from pyformlang.cfg import Variable
 import project.ecfg as ecfg_utils
+from project.boolean_backend import CSR, BooleanBackend, get_backend
 from project.finite_automatons_utils import get_states_and_matrix_from_nfa
-from scipy.sparse import dok_matrix
 
 
 class RSM(NamedTuple):
@@ -22,14 +22,20 @@ def rsm_from_ecfg(ecfg: ecfg_utils.ECFG) -> RSM:
 
 
 def create_boolean_decomposition_from_rsm(
-    rsm: RSM,
-) -> Dict[Variable, Dict[Any, dok_matrix]]:
+    rsm: RSM, backend: Union[str, BooleanBackend] = None
+) -> Dict[Variable, Dict[Any, Any]]:
     """
     Convert to boolean decomposition from rsm
+    :param backend: "csr", "dense", "bitset" or a BooleanBackend the matrices are stored in,
+        CSR matrices if None.
     """
+    box_backend = CSR if backend is None else get_backend(backend)
     decompositions = {}
     for key, value in rsm.boxes.items():
-        decompositions[key] = get_states_and_matrix_from_nfa(value)[1]
+        matrices = get_states_and_matrix_from_nfa(value)[1]
+        decompositions[key] = {
+            label: box_backend.from_sparse(matrix) for label, matrix in matrices.items()
+        }
     return decompositions
 
 
@@ -0,0 +1,235 @@
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import Epsilon
+from scipy.sparse import csr_matrix
+
+
+class VertexIndex:
+    """
+    Bidirectional mapping between vertex ids and dense indexes 0..n-1.
+    Ids are stored in an array, so translating indexes back to ids is a single fancy indexing.
+    Integer ids from a compact range are translated into indexes through a lookup array,
+    other ids through a dictionary. Both are built on the first lookup.
+    """
+
+    __slots__ = ("ids", "_indexed", "_positions", "_lookup")
+
+    def __init__(self, ids: Iterable[Any]):
+        if isinstance(ids, np.ndarray) and ids.dtype.kind in "iu":
+            # Integer arrays, e.g. memory-mapped ones, are used without a copy into Python objects.
+            self.ids = ids.astype(np.int64, copy=False)
+        else:
+            ids = list(ids)
+            if ids and all(isinstance(i, (int, np.integer)) for i in ids):
+                self.ids = np.asarray(ids, dtype=np.int64)
+            else:
+                self.ids = np.fromiter(ids, dtype=object, count=len(ids))
+
+        self._indexed = False
+        self._positions = None
+        self._lookup = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return self.ids[index]
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __contains__(self, node) -> bool:
+        return self.index(node) >= 0
+
+    def index(self, node) -> int:
+        """Returns the index of the vertex, -1 if it is unknown."""
+        return int(self.indexes([node])[0])
+
+    def indexes(self, nodes: Iterable[Any]) -> np.ndarray:
+        """Returns the indexes of the vertices, -1 for unknown ones."""
+        if not isinstance(nodes, np.ndarray):
+            nodes = list(nodes)
+            if all(isinstance(node, (int, np.integer)) for node in nodes):
+                nodes = np.asarray(nodes, dtype=np.int64)
+
+        positions = self._position_array()
+        if (
+            positions is not None
+            and isinstance(nodes, np.ndarray)
+            and nodes.dtype.kind in "iu"
+        ):
+            result = np.full(len(nodes), -1, dtype=np.int64)
+            known = (nodes >= 0) & (nodes < len(positions))
+            result[known] = positions[nodes[known]]
+            return result
+
+        if self._lookup is None:
+            self._lookup = {node: i for (i, node) in enumerate(self.ids.tolist())}
+        return np.fromiter(
+            (self._lookup.get(node, -1) for node in nodes),
+            dtype=np.int64,
+            count=len(nodes),
+        )
+
+    def mask(self, nodes: Iterable[Any] = None) -> np.ndarray:
+        """Returns a boolean vector marking the given vertices, all vertices if None. Unknown vertices are ignored."""
+        if nodes is None:
+            return np.ones(len(self), dtype=bool)
+
+        mask = np.zeros(len(self), dtype=bool)
+        indexes = self.indexes(nodes)
+        mask[indexes[indexes >= 0]] = True
+        return mask
+
+    def to_ids(self, indexes: np.ndarray) -> np.ndarray:
+        """Translates an array of indexes of any shape into an array of vertex ids."""
+        return self.ids[indexes]
+
+    def _position_array(self) -> Optional[np.ndarray]:
+        """Returns the lookup array from integer ids to indexes, None if the ids are not integers from a compact range."""
+        if not self._indexed:
+            if self.ids.dtype != object and len(self.ids) and self.ids.min() >= 0:
+                upper = int(self.ids.max()) + 1
+                if upper <= 4 * len(self.ids) + 1024:
+                    positions = np.full(upper, -1, dtype=np.int64)
+                    positions[self.ids] = np.arange(len(self.ids))
+                    self._positions = positions
+            self._indexed = True
+        return self._positions
+
+
+class MatrixAutomaton(NamedTuple):
+    """
+    Finite automaton in the form of a boolean decomposition.
+    State with index i is states[i], masks mark start and final states by index.
+    """
+
+    states: Union[VertexIndex, Sequence]
+    matrices: Dict[Any, csr_matrix]
+    start_mask: np.ndarray
+    final_mask: np.ndarray
+
+
+class LabeledGraph:
+    """
+    Compact labeled directed graph: vertex i is vertices[i], matrices[label][i, j] is set
+    if there is an edge i -> j with this label. Edges without a label are stored under Epsilon().
+    Only the index arrays of the CSR matrices are kept, there are no Python objects per vertex or edge,
+    and parallel edges with the same label are stored once.
+    It is accepted by the engines in place of a MultiDiGraph and must not be modified.
+    :param reverse: if True, the transposed matrices are built at once, otherwise on the first use
+    """
+
+    __slots__ = ("vertices", "matrices", "_reverse_matrices", "__weakref__")
+
+    def __init__(
+        self,
+        vertices: VertexIndex,
+        matrices: Dict[Any, csr_matrix],
+        reverse: bool = False,
+    ):
+        self.vertices = vertices
+        self.matrices = matrices
+        self._reverse_matrices = None
+        if reverse:
+            self._reverse_matrices = self.reverse_matrices
+
+    @classmethod
+    def from_edges(
+        cls,
+        vertices: VertexIndex,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        codes: np.ndarray,
+        labels: List[Any],
+    ) -> "LabeledGraph":
+        """
+        Builds the graph from arrays of edges: sources and targets are vertex indexes,
+        codes are positions of the edge labels in labels. The edges are grouped by a single sort of the codes.
+        """
+        count = len(vertices)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+        matrices = dict()
+        for code, label in enumerate(labels):
+            part = order[bounds[code] : bounds[code + 1]]
+            matrices[label] = csr_matrix(
+                (np.ones(len(part), dtype=bool), (sources[part], targets[part])),
+                shape=(count, count),
+            )
+        return cls(vertices, matrices)
+
+    @classmethod
+    def from_networkx(cls, graph: MultiDiGraph) -> "LabeledGraph":
+        """Builds the graph from the edges of a MultiDiGraph with a "label" field, interning the labels."""
+        vertices = VertexIndex(graph.nodes)
+
+        edges = list(graph.edges(data="label"))
+        sources = vertices.indexes([v for v, _, _ in edges])
+        targets = vertices.indexes([u for _, u, _ in edges])
+
+        eps = Epsilon()
+        label_ids = dict()
+        codes = np.fromiter(
+            (
+                label_ids.setdefault(eps if label is None else label, len(label_ids))
+                for _, _, label in edges
+            ),
+            dtype=np.int64,
+            count=len(edges),
+        )
+        return cls.from_edges(vertices, sources, targets, codes, list(label_ids))
+
+    def to_networkx(self) -> MultiDiGraph:
+        """Returns the MultiDiGraph with a "label" field on the edges, None for epsilon edges."""
+        graph = MultiDiGraph()
+        graph.add_nodes_from(self.vertices)
+        eps = Epsilon()
+        for label, matrix in self.matrices.items():
+            rows, columns = matrix.nonzero()
+            graph.add_edges_from(
+                zip(
+                    self.vertices.to_ids(rows).tolist(),
+                    self.vertices.to_ids(columns).tolist(),
+                ),
+                label=None if label == eps else label,
+            )
+        return graph
+
+    @property
+    def nodes(self) -> VertexIndex:
+        return self.vertices
+
+    def number_of_nodes(self) -> int:
+        return len(self.vertices)
+
+    def number_of_edges(self) -> int:
+        return sum(m.nnz for m in self.matrices.values())
+
+    @property
+    def labels(self) -> List[Any]:
+        return list(self.matrices.keys())
+
+    @property
+    def reverse_matrices(self) -> Dict[Any, csr_matrix]:
+        """Transposed matrices: reverse_matrices[label][j, i] is set if there is an edge i -> j."""
+        if self._reverse_matrices is None:
+            self._reverse_matrices = {
+                label: m.T.tocsr() for label, m in self.matrices.items()
+            }
+        return self._reverse_matrices
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory taken by the arrays of the graph."""
+        matrices = list(self.matrices.values())
+        if self._reverse_matrices is not None:
+            matrices += list(self._reverse_matrices.values())
+        return self.vertices.ids.nbytes + sum(
+            m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in matrices
+        )
+
+
+AnyGraph = Union[MultiDiGraph, LabeledGraph]
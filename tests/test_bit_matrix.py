@@ -0,0 +1,47 @@
+import pytest
+from scipy.sparse import random
+
+from project.bit_matrix import BitMatrix
+from project.closure import semi_naive_transitive_closure
+
+
+def random_dense(rows, columns, seed, density=0.2):
+    return (
+        random(rows, columns, density=density, random_state=seed).toarray().astype(bool)
+    )
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (3, 64), (70, 130), (130, 65), (0, 5)])
+def test_round_trip_and_transpose(shape):
+    dense = random_dense(*shape, seed=1)
+    matrix = BitMatrix.from_dense(dense)
+
+    assert (matrix.to_dense() == dense).all()
+    assert (matrix.to_csr().toarray() == dense).all()
+    assert matrix.nnz == dense.sum()
+    assert (matrix.T.to_dense() == dense.T).all()
+    assert (BitMatrix.from_sparse(matrix.to_csr()).words == matrix.words).all()
+
+
+def test_word_operations():
+    first = random_dense(50, 100, seed=2)
+    second = random_dense(100, 70, seed=3)
+    other = random_dense(50, 100, seed=4)
+    a, b, c = map(BitMatrix.from_dense, (first, second, other))
+
+    assert ((a @ b).to_dense() == (first.astype(int) @ second.astype(int) > 0)).all()
+    assert ((a | c).to_dense() == (first | other)).all()
+    assert (a.difference(c).to_dense() == (first & ~other)).all()
+
+    accumulated = a.copy()
+    accumulated |= c
+    assert (accumulated.to_dense() == (first | other)).all()
+    assert (a.to_dense() == first).all()
+
+
+def test_warshall_closure():
+    matrix = random(90, 90, density=0.02, format="csr", random_state=5).astype(bool)
+    expected = semi_naive_transitive_closure(matrix).matrix.toarray()
+
+    closure = BitMatrix.from_sparse(matrix).transitive_closure()
+    assert (closure.to_dense() == expected).all()
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from project.boolean_backend import (
+    BACKENDS,
+    BITSET,
+    CSR,
+    DENSE,
+    BooleanBackend,
+    CsrBackend,
+    choose_backend,
+    get_backend,
+)
+
+
+def random_matrix(rows, columns, seed):
+    return sp.random(
+        rows, columns, density=0.15, random_state=seed, format="csr"
+    ).astype(bool)
+
+
+@pytest.mark.parametrize("name", BACKENDS.keys())
+def test_operations_agree_with_scipy(name):
+    backend = BACKENDS[name]
+    for seed in range(10):
+        first = random_matrix(17, 30, seed)
+        second = random_matrix(30, 45, seed + 100)
+        other = random_matrix(17, 30, seed + 200)
+        a, b, c = map(backend.from_sparse, (first, second, other))
+
+        expected = {
+            "multiply": first @ second,
+            "multiply_sparse": first @ second,
+            "add": first + other,
+            "difference": first > other,
+            "kron": sp.kron(first, second),
+            "transpose": first.T,
+        }
+        actual = {
+            "multiply": backend.multiply(a, b),
+            "multiply_sparse": backend.multiply_sparse(first, b),
+            "add": backend.add(a, c),
+            "difference": backend.difference(a, c),
+            "kron": backend.kron(a, b),
+            "transpose": backend.transpose(a),
+        }
+        for operation, matrix in actual.items():
+            assert (
+                backend.to_csr(matrix).toarray()
+                == expected[operation].toarray().astype(bool)
+            ).all(), operation
+        assert backend.nnz(a) == first.nnz
+
+        rows_mask = np.arange(17) % 2 == 0
+        columns_mask = np.arange(30) % 3 == 0
+        rows, columns = backend.select_nonzero(
+            a, np.flatnonzero(rows_mask), columns_mask
+        )
+        dense = first.toarray() & rows_mask[:, None] & columns_mask[None, :]
+        assert sorted(zip(rows.tolist(), columns.tolist())) == list(
+            zip(*np.nonzero(dense))
+        )
+
+
+def test_backend_choice():
+    assert choose_backend(100, 0.001) is DENSE
+    assert choose_backend(10**5, 0.5) is BITSET
+    assert choose_backend(10**5, 10**-5) is CSR
+    assert get_backend("bitset") is BITSET
+    assert get_backend(CSR, 10) is CSR
+    with pytest.raises(ValueError):
+        get_backend("unknown")
+
+
+def test_incomplete_backend_is_rejected():
+    class IncompleteBackend(BooleanBackend):
+        def from_coo(self, rows, columns, shape):
+            return CSR.from_coo(rows, columns, shape)
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+    assert isinstance(CsrBackend(), BooleanBackend)
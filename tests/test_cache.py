@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from project.cache import LRUCache
+
+
+def test_lru_eviction_and_counters():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    info = cache.info()
+    assert (info.hits, info.misses, info.size, info.max_size) == (2, 1, 2, 2)
+
+
+def test_get_or_create_from_threads():
+    cache = LRUCache(max_size=8)
+    with ThreadPoolExecutor(8) as executor:
+        results = list(
+            executor.map(
+                lambda i: cache.get_or_create(i % 4, lambda: (i % 4) ** 2), range(100)
+            )
+        )
+
+    assert results == [(i % 4) ** 2 for i in range(100)]
+    assert len(cache) == 4
+    assert cache.info().hits + cache.info().misses == 100
+
+
+def test_eviction_by_weight():
+    cache = LRUCache(max_size=10, max_weight=10, weigh=len)
+    cache.put("a", "x" * 4)
+    cache.put("b", "x" * 4)
+    cache.put("c", "x" * 4)
+    assert "a" not in cache
+    assert cache.info().weight == 8
+
+    cache.invalidate("b")
+    cache.put("d", "x" * 11)
+    assert "d" not in cache
+    assert cache.info().weight == 4
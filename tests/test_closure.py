@@ -0,0 +1,86 @@
+import numpy as np
+from scipy.sparse import csr_matrix, random
+
+from project.closure import (
+    semi_naive_transitive_closure,
+    semi_naive_products_closure,
+    scc_transitive_closure,
+)
+
+
+def naive_closure(matrix):
+    closure = matrix.toarray()
+    while True:
+        new = closure | (closure.astype(int) @ closure.astype(int) > 0)
+        if (new == closure).all():
+            return closure
+        closure = new
+
+
+def test_semi_naive_closure_on_random_matrix():
+    matrix = random(40, 40, density=0.05, format="csr", random_state=7).astype(bool)
+    expected = naive_closure(matrix)
+
+    for squaring in (False, True):
+        closure = semi_naive_transitive_closure(matrix, squaring)
+        assert closure.matrix.format == "csr"
+        assert (closure.matrix.toarray() == expected).all()
+
+
+def test_semi_naive_closure_rounds_on_chain():
+    count = 16
+    chain = csr_matrix(
+        (np.ones(count - 1, dtype=bool), (range(count - 1), range(1, count))),
+        shape=(count, count),
+    )
+
+    linear = semi_naive_transitive_closure({"a": chain})
+    squaring = semi_naive_transitive_closure({"a": chain}, squaring=True)
+
+    assert linear.matrix.nnz == count * (count - 1) // 2
+    assert squaring.matrix.nnz == linear.matrix.nnz
+    assert linear.rounds == count - 1
+    assert squaring.rounds < linear.rounds
+
+
+def test_semi_naive_products_closure():
+    a = csr_matrix(([True], ([0], [1])), shape=(3, 3))
+    b = csr_matrix(([True], ([1], [2])), shape=(3, 3))
+    s = csr_matrix((3, 3), dtype=bool)
+
+    matrices, rounds = semi_naive_products_closure(
+        {"A": a, "B": b, "S": s}, [("S", "A", "B")]
+    )
+
+    assert list(zip(*matrices["S"].nonzero())) == [(0, 2)]
+    assert rounds == 2
+
+
+def test_scc_closure_matches_semi_naive():
+    matrix = random(60, 60, density=0.04, format="csr", random_state=3).astype(bool)
+    expected = semi_naive_transitive_closure(matrix).matrix.toarray()
+
+    closure = scc_transitive_closure({"a": matrix})
+
+    assert (closure.to_matrix().toarray() == expected).all()
+
+    rows_mask = np.arange(60) % 3 == 0
+    columns_mask = np.arange(60) % 2 == 0
+    pairs = closure.pairs(np.flatnonzero(rows_mask), closure.targets(columns_mask))
+    assert len(pairs) == expected[rows_mask][:, columns_mask].sum()
+    assert expected[pairs[:, 0], pairs[:, 1]].all()
+
+
+def test_scc_closure_of_acyclic_singletons():
+    matrix = csr_matrix(([True, True, True], ([0, 1, 2], [1, 2, 2])), shape=(4, 4))
+    closure = scc_transitive_closure(matrix)
+    component = closure.components
+
+    assert set(closure.reachable_components(component[0])) == {
+        component[1],
+        component[2],
+    }
+    assert set(closure.reachable_components(component[1])) == {component[2]}
+    assert set(closure.reachable_components(component[2])) == {component[2]}
+    assert len(closure.reachable_components(component[3])) == 0
+    assert closure.pairs(np.array([1, 3])).tolist() == [[1, 2]]
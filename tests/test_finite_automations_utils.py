@@ -1,7 +1,11 @@
 import pytest
+import numpy as np
+import random
+import networkx as nx
 from project import graph_utils
 from project import finite_automatons_utils
 from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, EpsilonNFA
+from scipy.sparse import csr_matrix
 
 
 def setup_module(module):
@@ -37,6 +41,21 @@ def test_build_graph_dfa_from_simple_regex():
     assert dfa.is_equivalent_to(dfa_min)
 
 
+def test_compile_regex_is_cached():
+    finite_automatons_utils.regex_cache.clear()
+
+    first = finite_automatons_utils.compile_regex("a  b* | c")
+    second = finite_automatons_utils.compile_regex(" a b* | c ")
+
+    assert first is second
+    assert first.dfa.is_equivalent_to(
+        finite_automatons_utils.build_dfa_from_regex("a b* | c")
+    )
+    assert first.automaton.matrices.keys() == {"a", "b", "c"}
+    info = finite_automatons_utils.regex_cache.info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
 def test_build_from_networkx_graph():
     first_size = 3
     second_size = 2
@@ -106,6 +125,44 @@ def test_intersect_two_automata():
     assert expected.is_equivalent_to(actual)
 
 
+def test_matrix_intersection_automata():
+    nfa1 = EpsilonNFA()
+    nfa1.add_start_state(0)
+    nfa1.add_final_state(0)
+    nfa1.add_transitions([(0, "a", 1), (0, "b", 1), (1, "b", 0)])
+
+    nfa2 = EpsilonNFA()
+    nfa2.add_start_state(0)
+    nfa2.add_final_state(2)
+    nfa2.add_transitions([(0, "a", 1), (1, "b", 2), (2, "b", 0), (0, "b", 2)])
+
+    actual = finite_automatons_utils.matrix_intersection_automations(nfa1, nfa2)
+
+    assert len(actual.states) == 6
+    assert actual.matrices.keys() == {"a", "b"}
+    assert actual.matrices["a"].format == "csr"
+    assert actual.matrices["a"].nnz == 1
+    assert actual.matrices["b"].nnz == 6
+    assert actual.start_mask.sum() == 1
+    assert actual.final_mask.sum() == 1
+
+
+def test_build_nfa_from_large_sparse_matrix():
+    count_states = 100_000
+    matrix = {
+        "a": csr_matrix(
+            ([True, True, True], ([0, 1, 99_999], [1, 99_999, 0])),
+            shape=(count_states, count_states),
+        )
+    }
+
+    nfa = finite_automatons_utils.build_nfa(matrix, range(count_states), [0], [0])
+
+    assert nfa.get_number_transitions() == 3
+    assert nfa.accepts(["a", "a", "a"])
+    assert not nfa.accepts(["a", "a"])
+
+
 def test_fdf():
     regex = "(a | b)*"
     graph = graph_utils.create_labeled_graph_with_two_cycle(1, 2, labels=("a", "b"))
@@ -117,6 +174,54 @@ def test_fdf():
     assert {(1, 0)} == got
 
 
+def test_rpq_pairs():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(1, 2, labels=("a", "b"))
+
+    pairs = finite_automatons_utils.rpq_pairs("(a | b)*", graph, [0, 2], [2, 1])
+
+    assert pairs.shape == (4, 2)
+    assert pairs.dtype.kind == "i"
+    assert finite_automatons_utils.pairs_to_set(pairs) == {
+        (0, 1),
+        (0, 2),
+        (2, 1),
+        (2, 2),
+    }
+
+
+def test_rpq_with_arbitrary_node_ids():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 2, labels=("a", "b"))
+    relabeled = nx.relabel_nodes(graph, lambda node: f"v{node * 10}")
+
+    expected = finite_automatons_utils.rpq("a* b", graph, [0, 1], [4, 5])
+    actual = finite_automatons_utils.rpq(
+        "a* b", relabeled, ["v0", "v10"], ["v40", "v50"]
+    )
+    assert actual == {(f"v{x * 10}", f"v{y * 10}") for x, y in expected}
+
+    expected = finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+        graph, "a* b", True
+    )
+    actual = finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+        relabeled, "a* b", True
+    )
+    assert actual == {
+        f"v{x * 10}": sorted(f"v{y * 10}" for y in ys) for x, ys in expected.items()
+    }
+
+
+def test_rpq_closure_modes():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 2, labels=("a", "b"))
+
+    for regex in ("a*", "(a | b)*", "a b* a"):
+        expected = finite_automatons_utils.rpq(regex, graph, [0, 1, 4], [0, 3, 5])
+        for mode in ("squaring", "scc", "warshall"):
+            actual = finite_automatons_utils.rpq(
+                regex, graph, [0, 1, 4], [0, 3, 5], closure_mode=mode
+            )
+            assert actual == expected
+
+
 def test_rpq_with_separated():
     graph = graph_utils.create_labeled_graph_with_two_cycle(3, 3, ("a", "b"))
     regex = "(a*|b)"
@@ -137,6 +242,33 @@ def test_rpq_with_separated():
     assert result == expected
 
 
+def test_rpq_statistics():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 3, ("a", "b"))
+    statistics = []
+    finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+        graph, "a*", False, [0], None, statistics
+    )
+
+    assert [iteration.front_nnz for iteration in statistics] == [1, 1, 1, 1, 0]
+    assert statistics[-1].visited_nnz == 4
+
+
+def test_chunked_rpq_with_separated():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 3, ("a", "b"))
+    expected = finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+        graph, "(a*|b)", True
+    )
+
+    for memory_budget, processes in ((None, None), (1, None), (600, 2)):
+        result = dict(
+            finite_automatons_utils.iter_bfs_based_rpq_from_graph_and_regex(
+                graph, "(a*|b)", memory_budget=memory_budget, processes=processes
+            )
+        )
+        assert {start: fin for start, fin in result.items() if fin} == expected
+        assert result.keys() == set(graph.nodes)
+
+
 def test_rpq_without_separated():
     graph = graph_utils.create_labeled_graph_with_two_cycle(3, 3, labels=("a", "b"))
     regex = "(a*|b)"
@@ -146,3 +278,167 @@ def test_rpq_without_separated():
 
     expected = {0, 1, 2, 3, 4, 5, 6}
     assert result == expected
+
+
+def test_build_matrix_automaton_from_networkx_graph():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 2, labels=("a", "b"))
+    automaton = finite_automatons_utils.build_matrix_automaton_from_networkx_graph(
+        graph, [0], [3, 5]
+    )
+
+    assert automaton.matrices.keys() == {"a", "b"}
+    for label, matrix in automaton.matrices.items():
+        rows, columns = matrix.nonzero()
+        actual = {
+            (automaton.states[i], automaton.states[j]) for i, j in zip(rows, columns)
+        }
+        expected = {(v, u) for v, u, l in graph.edges(data="label") if l == label}
+        assert actual == expected
+
+    assert [automaton.states[i] for i in automaton.start_mask.nonzero()[0]] == [0]
+    assert {automaton.states[i] for i in automaton.final_mask.nonzero()[0]} == {3, 5}
+
+
+def test_bfs_based_rpq_agrees_with_rpq():
+    rng = random.Random(1)
+    for _ in range(20):
+        graph = nx.MultiDiGraph()
+        count = rng.randint(1, 12)
+        graph.add_nodes_from(range(count))
+        for _ in range(rng.randint(0, 25)):
+            graph.add_edge(
+                rng.randrange(count), rng.randrange(count), label=rng.choice("abc")
+            )
+        regex = rng.choice(["a*", "(a|b)*", "a b* c", "a* b | c", "(a b)* c*"])
+        start_nodes = rng.sample(range(count), rng.randint(1, count))
+        final_nodes = rng.sample(range(count), rng.randint(1, count))
+
+        expected = finite_automatons_utils.rpq(regex, graph, start_nodes, final_nodes)
+        expected_separately = {}
+        for start, final in sorted(expected):
+            expected_separately.setdefault(start, []).append(final)
+
+        assert expected_separately == (
+            finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+                graph, regex, True, start_nodes, final_nodes
+            )
+        )
+        assert {final for _, final in expected} == (
+            finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+                graph, regex, False, start_nodes, final_nodes
+            )
+        )
+
+
+def test_threaded_products():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(4, 5, ("a", "b"))
+    regex = "a* b (a | b)*"
+
+    assert finite_automatons_utils.rpq(regex, graph) == finite_automatons_utils.rpq(
+        regex, graph, threads=4
+    )
+    for separately in (True, False):
+        assert finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+            graph, regex, separately
+        ) == finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+            graph, regex, separately, threads=4
+        )
+
+
+@pytest.mark.parametrize("backend", ["csr", "dense", "bitset"])
+def test_backends_agree(backend):
+    graph = graph_utils.create_labeled_graph_with_two_cycle(4, 5, ("a", "b"))
+    regex = "a* b (a | b)*"
+
+    assert finite_automatons_utils.rpq(regex, graph) == finite_automatons_utils.rpq(
+        regex, graph, backend=backend
+    )
+    for separately in (True, False):
+        assert finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+            graph, regex, separately, backend="csr"
+        ) == finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+            graph, regex, separately, backend=backend
+        )
+
+
+def test_streamed_pairs():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(4, 5, ("a", "b"))
+    regex = "a* b (a | b)*"
+    expected = finite_automatons_utils.rpq(regex, graph)
+
+    for mode in finite_automatons_utils.CLOSURE_MODES:
+        blocks = list(
+            finite_automatons_utils.iter_rpq_pairs(
+                regex, graph, closure_mode=mode, chunk_size=3
+            )
+        )
+        assert len(blocks) > 1
+        pairs = np.concatenate(blocks).tolist()
+        assert len(pairs) == len(expected)
+        assert set(map(tuple, pairs)) == expected
+
+    separated = finite_automatons_utils.bfs_based_rpq_from_graph_and_regex(
+        graph, regex, True
+    )
+    blocks = list(
+        finite_automatons_utils.iter_bfs_based_rpq_pairs_from_graph_and_regex(
+            graph, regex, memory_budget=1
+        )
+    )
+    assert len(blocks) > 1
+    assert set(map(tuple, np.concatenate(blocks).tolist())) == {
+        (start, final) for start, finals in separated.items() for final in finals
+    }
+
+
+def test_prune_matrix_automaton():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 4, ("a", "b"))
+    graph.add_edge(0, 100, label="c")
+    graph.add_edge(101, 0, label="a")
+    second = finite_automatons_utils.compile_regex("a*").automaton
+
+    first = finite_automatons_utils.build_matrix_automaton_from_networkx_graph(
+        graph, [0, 101], None
+    )
+    pruned = finite_automatons_utils.prune_matrix_automaton(first, second)
+    assert set(pruned.states) == {0, 1, 2, 3, 101}
+    assert pruned.matrices.keys() == {"a"}
+
+    for separately in (True, False):
+        assert finite_automatons_utils.bfs_based_rpq_from_matrix_automata(
+            first, second, separately
+        ) == finite_automatons_utils.bfs_based_rpq_from_matrix_automata(
+            pruned, second, separately
+        )
+
+    first = finite_automatons_utils.build_matrix_automaton_from_networkx_graph(
+        graph, [0], [2]
+    )
+    pruned = finite_automatons_utils.prune_matrix_automaton(first, second)
+    assert set(pruned.states) == {0, 1, 2, 3}
+
+
+def test_states_and_matrix_from_nfa_agree_with_matrix_automaton():
+    nfa = EpsilonNFA()
+    nfa.add_start_state(0)
+    nfa.add_final_state(2)
+    nfa.add_transitions([(0, "a", 1), (1, "b", 2), (2, "a", 0), (0, "a", 2)])
+
+    indexed_states, matrices = finite_automatons_utils.get_states_and_matrix_from_nfa(
+        nfa
+    )
+    automaton = finite_automatons_utils.matrix_automaton_from_nfa(nfa)
+
+    assert sorted(indexed_states.values()) == [0, 1, 2]
+    assert matrices.keys() == automaton.matrices.keys()
+    for state, index in indexed_states.items():
+        assert automaton.states[index] == state.value
+    edges = {
+        (label, indexes[0], indexes[1])
+        for label, matrix in matrices.items()
+        for indexes in zip(*matrix.nonzero())
+    }
+    expected = {(0, "a", 1), (1, "b", 2), (2, "a", 0), (0, "a", 2)}
+    assert {
+        (automaton.states[v], str(label), automaton.states[u]) for label, v, u in edges
+    } == expected
@@ -0,0 +1,92 @@
+import gc
+
+import networkx as nx
+
+from project.graph_cache import (
+    DecompositionCache,
+    decompose_graph,
+    mark_graph_changed,
+    track_graph_changes,
+)
+from project.finite_automatons_utils import rpq
+
+
+def build_graph(tracked: bool = True):
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    graph.add_edge(2, 0, label="a")
+    if tracked:
+        track_graph_changes(graph)
+    return graph
+
+
+def test_decompose_graph():
+    decomposition = decompose_graph(build_graph())
+    vertices, matrices = decomposition.vertices, decomposition.matrices
+    assert list(vertices) == [0, 1, 2]
+    assert set(zip(*matrices["a"].nonzero())) == {(0, 1), (2, 0)}
+    assert set(zip(*matrices["b"].nonzero())) == {(1, 2)}
+
+
+def test_cache_reuses_and_rebuilds_on_changes():
+    cache = DecompositionCache()
+    graph = build_graph()
+    first = cache.get(graph)
+    assert cache.get(graph) is first
+
+    graph.add_edge(0, 2, label="c")
+    second = cache.get(graph)
+    assert second is not first
+    assert "c" in second.matrices
+
+    graph.edges[0, 2, 0]["label"] = "d"
+    mark_graph_changed(graph)
+    assert "d" in cache.get(graph).matrices
+
+    cache.invalidate(graph)
+    assert graph not in cache
+    assert cache.info().misses == 3
+
+
+def test_cache_drops_collected_graphs():
+    cache = DecompositionCache()
+    graph = build_graph()
+    cache.get(graph)
+    assert cache.info().size == 1
+
+    del graph
+    gc.collect()
+    assert cache.info().size == 0
+
+
+def test_cache_is_bounded_by_memory():
+    graphs = [build_graph() for _ in range(4)]
+    size = decompose_graph(graphs[0]).nbytes
+    cache = DecompositionCache(max_graphs=10, max_bytes=2 * size)
+    for graph in graphs:
+        cache.get(graph)
+
+    assert cache.info().size == 2
+    assert cache.info().weight <= 2 * size
+    assert graphs[0] not in cache and graphs[3] in cache
+
+
+def test_untracked_graphs_are_not_cached():
+    cache = DecompositionCache()
+    graph = build_graph(tracked=False)
+    assert cache.get(graph) is not cache.get(graph)
+    assert graph not in cache
+
+
+def test_count_preserving_edits():
+    graph = build_graph(tracked=False)
+    assert rpq("a", graph) == {(0, 1), (2, 0)}
+
+    graph.remove_edge(0, 1)
+    graph.add_edge(1, 2, label="a")
+    assert rpq("a", graph) == {(1, 2), (2, 0)}
+
+    graph[1][2][0]["label"] = "c"
+    assert rpq("c", graph) == {(1, 2)}
+    assert rpq("b", graph) == set()
@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from project import graph_store, graph_utils
+from project.finite_automatons_utils import (
+    bfs_based_rpq_from_graph_and_regex,
+    bfs_based_rpq_from_matrix_automata,
+    build_matrix_automaton_from_networkx_graph,
+    compile_regex,
+)
+from project.graph_cache import decompose_graph
+
+
+def test_store_and_load(tmp_path):
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 4, ("a", "b"))
+    graph.add_edge(1, 5)
+    root = str(tmp_path)
+    graph_store.store_graph(graph, "two_cycles", root)
+
+    assert graph_store.has_stored_graph("two_cycles", root)
+    assert graph_store.stored_graph_names(root) == ["two_cycles"]
+    metadata = graph_store.read_stored_metadata("two_cycles", root)
+    assert metadata["count_vertices"] == 8 and metadata["count_edges"] == 10
+
+    expected = decompose_graph(graph)
+    for mmap in (True, False):
+        loaded = graph_store.load_stored_graph("two_cycles", root, mmap)
+        assert list(loaded.vertices) == list(expected.vertices)
+        assert loaded.matrices.keys() == expected.matrices.keys()
+        for label, matrix in expected.matrices.items():
+            assert (loaded.matrices[label] != matrix).nnz == 0
+        assert loaded.matrices["a"].indices.flags.writeable != mmap
+        assert loaded.matrices["a"].data.flags.writeable != mmap
+
+    loaded = graph_store.load_stored_graph("two_cycles", root)
+    assert bfs_based_rpq_from_matrix_automata(
+        build_matrix_automaton_from_networkx_graph(loaded, [0]),
+        compile_regex("a* b*").automaton,
+        True,
+    ) == bfs_based_rpq_from_graph_and_regex(graph, "a* b*", True, [0])
+
+
+def test_store_rejects_other_versions(tmp_path):
+    root = str(tmp_path)
+    with pytest.raises(FileNotFoundError):
+        graph_store.load_stored_graph("missing", root)
+
+    graph = graph_utils.create_labeled_graph_with_two_cycle(1, 1, ("a", "b"))
+    path = graph_store.store_graph(graph, "graph", root)
+    metadata_path = os.path.join(path, graph_store.METADATA_FILE)
+    with open(metadata_path) as file:
+        metadata = json.load(file)
+    metadata["version"] += 1
+    with open(metadata_path, "w") as file:
+        json.dump(metadata, file)
+
+    with pytest.raises(ValueError):
+        graph_store.load_stored_graph("graph", root)
@@ -0,0 +1,104 @@
+import gzip
+
+import cfpq_data
+from pyformlang.finite_automaton import Epsilon
+
+from project import graph_utils
+from project.graph_cache import decompose_graph
+
+
+def assert_same_decomposition(actual, expected):
+    assert set(actual.vertices) == set(expected.vertices)
+    assert actual.matrices.keys() == expected.matrices.keys()
+    for label, matrix in expected.matrices.items():
+        rows, columns = actual.matrices[label].nonzero()
+        expected_rows, expected_columns = matrix.nonzero()
+        assert set(
+            zip(actual.vertices.to_ids(rows), actual.vertices.to_ids(columns))
+        ) == set(
+            zip(
+                expected.vertices.to_ids(expected_rows),
+                expected.vertices.to_ids(expected_columns),
+            )
+        )
+
+
+def test_read_edge_list_agrees_with_cfpq_data(tmp_path):
+    graph = graph_utils.create_labeled_graph_with_two_cycle(5, 3, ("a", "b"))
+    path = tmp_path / "graph.csv"
+    path.write_text(
+        "".join(f"{v} {u} {label}\n" for v, u, label in graph.edges(data="label"))
+    )
+
+    expected = decompose_graph(cfpq_data.graph_from_csv(path))
+    assert_same_decomposition(graph_utils.read_edge_list(str(path)), expected)
+    assert_same_decomposition(
+        graph_utils.read_edge_list(str(path), chunk_rows=2), expected
+    )
+
+
+def test_read_gzipped_tsv_with_epsilon_edges(tmp_path):
+    path = tmp_path / "graph.tsv.gz"
+    with gzip.open(path, "wt") as file:
+        file.write("x\ty\ta\ny\tz\t\nz\tx\tb\nx\ty\ta\n")
+
+    decomposition = graph_utils.read_edge_list(str(path), chunk_rows=3)
+    assert set(decomposition.vertices) == {"x", "y", "z"}
+    assert decomposition.matrices.keys() == {"a", "b", Epsilon()}
+    assert decomposition.matrices["a"].nnz == 1
+    assert decomposition.matrices[Epsilon()].nnz == 1
+
+
+def test_edge_list_statistics(tmp_path):
+    graph = graph_utils.create_labeled_graph_with_two_cycle(4, 2, ("a", "b"))
+    graph.add_edge(1, 7, label="c")
+    graph.add_edge(1, 7, label="c")
+    path = tmp_path / "graph.csv"
+    path.write_text(
+        "".join(f"{v} {u} {label}\n" for v, u, label in graph.edges(data="label"))
+    )
+
+    info = graph_utils.get_edge_list_info(str(path), statistics=True)
+    assert info == graph_utils.get_graph_info(graph, statistics=True)
+    assert graph_utils.get_edge_list_info(str(path)) == graph_utils.get_graph_info(
+        cfpq_data.graph_from_csv(path)
+    )
+    assert info.label_counts == {"a": 5, "b": 3, "c": 2}
+    assert info.out_degree_histogram == {0: 1, 1: 5, 2: 1, 3: 1}
+    assert info.in_degree_histogram == {1: 6, 2: 2}
+    assert info.scc == graph_utils.SccSummary(count=2, largest=7, count_singletons=1)
+
+
+def test_vertex_ids_do_not_depend_on_chunks(tmp_path):
+    path = tmp_path / "graph.csv"
+    path.write_text("0 1 a\n1 2 b\n2 x a\n1 0 a\n")
+
+    for chunk_rows in (1, 2, 3, graph_utils.EDGE_LIST_CHUNK_ROWS):
+        decomposition = graph_utils.read_edge_list(str(path), chunk_rows=chunk_rows)
+        assert sorted(decomposition.vertices) == ["0", "1", "2", "x"]
+        assert decomposition.matrices["a"].nnz == 3
+
+    path.write_text("0 1 a\n1 -2 b\n")
+    for chunk_rows in (1, 2):
+        decomposition = graph_utils.read_edge_list(str(path), chunk_rows=chunk_rows)
+        assert sorted(decomposition.vertices) == [-2, 0, 1]
+
+
+def test_cfpq_data_separator_keeps_commas_in_labels(tmp_path):
+    path = tmp_path / "graph.csv"
+    path.write_text("0 1 rdf:type,x\n1 2 b\n")
+
+    decomposition = graph_utils.read_edge_list(
+        str(path), graph_utils.CFPQ_DATA_SEPARATOR
+    )
+    assert decomposition.matrices.keys() == {"rdf:type,x", "b"}
+    assert sorted(decomposition.vertices) == [0, 1, 2]
+
+    info = graph_utils.get_edge_list_info(
+        str(path), separator=graph_utils.CFPQ_DATA_SEPARATOR
+    )
+    assert info == graph_utils.GraphInfo(3, 2, ["b", "rdf:type,x"])
+    full = graph_utils.get_edge_list_info(
+        str(path), True, graph_utils.CFPQ_DATA_SEPARATOR
+    )
+    assert info == graph_utils.GraphInfo(*full[:3])
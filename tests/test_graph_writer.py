@@ -0,0 +1,80 @@
+import networkx as nx
+import numpy as np
+from networkx.drawing import nx_pydot
+
+from project import graph_utils
+from project.graph_writer import dot_id, write_dot, write_edge_list
+from project.sparse_graph import LabeledGraph
+
+
+def test_dot_matches_fixture(tmp_path):
+    path = tmp_path / "graph.dot"
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 2, ("c", "d"))
+    write_dot(graph, str(path))
+
+    with open(
+        "tests/test_create_two_cycle_labeled_graph/excepted_three_and_two.dot"
+    ) as file:
+        assert path.read_text() == file.read()
+
+
+def test_dot_quotes_identifiers(tmp_path):
+    assert dot_id(12) == "12" and dot_id("1.5") == "1.5" and dot_id("a_b") == "a_b"
+    assert dot_id(-1) == '"-1"' and dot_id("é") == '"é"' and dot_id("1a") == '"1a"'
+    assert dot_id("x y") == '"x y"' and dot_id('a"b') == '"a\\"b"'
+    assert dot_id("node") == '"node"'
+
+    graph = nx.MultiDiGraph()
+    graph.add_edge("x y", "node", label="a b")
+    graph.add_edge("x y", "node")
+    path = tmp_path / "graph.dot"
+    write_dot(graph, str(path))
+    loaded = nx_pydot.read_dot(str(path))
+    assert sorted(loaded.edges(data="label"), key=str) == [
+        ("x y", "node", '"a b"'),
+        ("x y", "node", None),
+    ]
+
+
+def test_labeled_graph_writers(tmp_path):
+    graph = graph_utils.create_labeled_graph_with_two_cycle(4, 3, ("a", "b"))
+    graph.add_edge(2, 5)
+    labeled = LabeledGraph.from_networkx(graph)
+
+    dot_path = tmp_path / "graph.dot"
+    write_dot(labeled, str(dot_path))
+    loaded = nx_pydot.read_dot(str(dot_path))
+    assert sorted(loaded.edges(data="label"), key=str) == sorted(
+        ((str(v), str(u), label) for v, u, label in graph.edges(data="label")),
+        key=str,
+    )
+
+    for source in (graph, labeled):
+        path = tmp_path / "graph.csv"
+        write_edge_list(source, str(path))
+        restored = graph_utils.read_edge_list(str(path))
+        assert graph_utils.get_graph_info(restored) == graph_utils.get_graph_info(
+            labeled
+        )
+        assert {
+            (label, v, u)
+            for label, matrix in restored.matrices.items()
+            for v, u in zip(*restored.vertices.to_ids(np.array(matrix.nonzero())))
+        } == {
+            (label, v, u)
+            for label, matrix in labeled.matrices.items()
+            for v, u in zip(*labeled.vertices.to_ids(np.array(matrix.nonzero())))
+        }
+
+
+def test_dot_round_trip_with_negative_ids(tmp_path):
+    graph = nx.MultiDiGraph()
+    graph.add_edge(-1, "é", label="a")
+    graph.add_edge("é", -2.5, label="-b")
+    path = tmp_path / "graph.dot"
+
+    for source in (graph, LabeledGraph.from_networkx(graph)):
+        write_dot(source, str(path))
+        loaded = nx_pydot.read_dot(str(path))
+        assert set(loaded.nodes) == {"-1", "é", "-2.5"}
+        assert {(v, u) for v, u in loaded.edges()} == {("-1", "é"), ("é", "-2.5")}
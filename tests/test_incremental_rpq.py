@@ -0,0 +1,48 @@
+import random
+
+import networkx as nx
+import pytest
+
+from project import graph_utils
+from project.finite_automatons_utils import rpq
+from project.incremental_rpq import MaterializedRpq
+
+
+def test_initial_answer_matches_rpq():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 2, ("a", "b"))
+    materialized = MaterializedRpq(graph, "a* b", [0, 1], None)
+    assert materialized.answer() == rpq("a* b", graph, [0, 1], None)
+
+
+@pytest.mark.parametrize("regex", ["a*", "a b* c", "(a | b)* c", "a (b | c)*"])
+def test_updates_match_recomputation(regex):
+    rng = random.Random(3)
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(range(6))
+    materialized = MaterializedRpq(graph, regex, [0, 1, 2, 7], None)
+
+    edges = []
+    for _ in range(15):
+        if edges and rng.random() < 0.4:
+            batch = rng.sample(edges, rng.randint(1, min(3, len(edges))))
+            for edge in batch:
+                edges.remove(edge)
+            materialized.remove_edges(batch)
+        else:
+            batch = [
+                (rng.randrange(9), rng.choice("abc"), rng.randrange(9))
+                for _ in range(rng.randint(1, 4))
+            ]
+            edges.extend(batch)
+            materialized.add_edges(batch)
+
+        assert graph.number_of_edges() == len(edges)
+        assert materialized.answer() == rpq(regex, graph, [0, 1, 2, 7], None)
+
+
+def test_remove_missing_edge():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(2, 2, ("a", "b"))
+    materialized = MaterializedRpq(graph, "a*")
+    with pytest.raises(ValueError):
+        materialized.remove_edge(0, "b", 1)
+    assert graph.number_of_edges() == 6
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from project.finite_automatons_utils import build_dfa_from_regex
+from project.regex_compiler import (
+    compile_regex_to_matrix_automaton,
+    dfa_from_matrix_automaton,
+)
+
+
+@pytest.mark.parametrize(
+    "regex",
+    [
+        "$",
+        "a*",
+        "a+",
+        "(a|$)(b|$)",
+        "((a b)*)*",
+        "xy* (x | y*) | ab (x | y*) | (x | a*) (x | y*)",
+        "a (b c | b d)* (b c)",
+        "(a|b)* a (a|b) (a|b) (a|b)",
+        "(" + " | ".join(f"l{i} m{i % 7}" for i in range(30)) + ")* x",
+    ],
+)
+def test_equivalent_to_pyformlang_minimal_dfa(regex):
+    expected = build_dfa_from_regex(regex)
+    automaton = compile_regex_to_matrix_automaton(regex)
+    actual = dfa_from_matrix_automaton(automaton)
+
+    assert actual.is_deterministic()
+    assert actual.is_equivalent_to(expected)
+    assert len(automaton.states) == len(expected.states)
+    assert np.flatnonzero(automaton.start_mask).tolist() == [0]
+
+
+def test_final_states():
+    automaton = compile_regex_to_matrix_automaton("a b*")
+    assert automaton.final_mask.any()
+
+    automaton = compile_regex_to_matrix_automaton("(a|b)* $")
+    assert len(automaton.states) == 1
+    assert automaton.final_mask.all()
@@ -0,0 +1,83 @@
+import random
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from project import graph_utils
+from project.finite_automatons_utils import (
+    bfs_based_rpq_from_graph_and_regex,
+    build_query_automata,
+)
+from project.rpq_planner import (
+    DIRECTIONS,
+    BidirectionalSearch,
+    planned_bfs_based_rpq_from_graph_and_regex,
+    reverse_matrix_automaton,
+)
+
+
+@pytest.mark.parametrize("direction", DIRECTIONS)
+def test_directions_agree_with_forward_search(direction):
+    rng = random.Random(5)
+    for _ in range(10):
+        graph = nx.MultiDiGraph()
+        count = rng.randint(1, 12)
+        graph.add_nodes_from(range(count))
+        for _ in range(rng.randint(0, 25)):
+            graph.add_edge(
+                rng.randrange(count), rng.randrange(count), label=rng.choice("abc")
+            )
+        regex = rng.choice(["a*", "(a|b)*", "a b* c", "a* b | c", "(a b)* c*"])
+        start_nodes = rng.sample(range(count), rng.randint(1, count))
+        final_nodes = rng.sample(range(count), rng.randint(1, count))
+
+        for separately in (True, False):
+            plans = []
+            actual = planned_bfs_based_rpq_from_graph_and_regex(
+                graph, regex, separately, start_nodes, final_nodes, direction, plans
+            )
+            expected = bfs_based_rpq_from_graph_and_regex(
+                graph, regex, separately, start_nodes, final_nodes
+            )
+            assert actual == expected
+            assert plans[0].direction == direction
+
+
+def test_plan_prefers_smaller_side():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(20, 20, ("a", "b"))
+    plans = []
+    planned_bfs_based_rpq_from_graph_and_regex(
+        graph, "a* b", True, None, [0], plans=plans
+    )
+    planned_bfs_based_rpq_from_graph_and_regex(
+        graph, "a* b", True, [0], None, plans=plans
+    )
+
+    assert [plan.direction for plan in plans] == ["backward", "forward"]
+    assert plans[0].count_finals == 1
+    assert plans[0].backward_cost < plans[0].forward_cost
+
+
+def test_plan_alternates_searches_of_comparable_cost():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(600, 600, ("a", "b"))
+    for separately in (False, True):
+        plans = []
+        actual = planned_bfs_based_rpq_from_graph_and_regex(
+            graph, "a* b", separately, plans=plans
+        )
+
+        assert plans[0].direction == "bidirectional"
+        assert min(plans[0].forward_cost, plans[0].backward_cost) >= 1024
+        assert actual == bfs_based_rpq_from_graph_and_regex(graph, "a* b", separately)
+
+
+def test_bidirectional_search_prunes_by_complete_side():
+    graph = nx.MultiDiGraph()
+    graph.add_edges_from([(0, 1), (1, 2), (2, 3)], label="a")
+    graph.add_edges_from([(1, 4), (4, 5), (5, 6), (6, 7)], label="b")
+    first, second = build_query_automata(graph, "a* b*", [0], [3])
+    search = BidirectionalSearch(first, second, reverse_matrix_automaton(first))
+
+    accepted = first.states.to_ids(np.flatnonzero(search.accepted_vertices()))
+    assert accepted.tolist() == [3]
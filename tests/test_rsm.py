@@ -3,7 +3,13 @@ from pyformlang.cfg import Variable
 from pyformlang.regular_expression import Regex
 
 from project.ecfg import ECFG
-from project.rsm import rsm_from_ecfg, minimize_rsm
+from scipy.sparse import csr_matrix
+
+from project.rsm import (
+    create_boolean_decomposition_from_rsm,
+    minimize_rsm,
+    rsm_from_ecfg,
+)
 
 
 def test_create_rsm_from_ecfg():
@@ -32,3 +38,21 @@ def test_minimize():
         rsm.boxes[v] == expected_ecfg.productions[v].to_epsilon_nfa().minimize()
         for v in expected_ecfg.productions.keys()
     )
+
+
+def test_boolean_decomposition_defaults_to_csr():
+    ecfg_prod = {Variable("S"): Regex("((a.(S.b))|$)")}
+    rsm = rsm_from_ecfg(ECFG(ecfg_prod.keys(), ecfg_prod, Variable("S")))
+
+    decomposition = create_boolean_decomposition_from_rsm(rsm)
+    assert all(
+        isinstance(matrix, csr_matrix)
+        for matrices in decomposition.values()
+        for matrix in matrices.values()
+    )
+    dense = create_boolean_decomposition_from_rsm(rsm, "dense")
+    assert all(
+        (dense[v][label] == matrix.toarray()).all()
+        for v, matrices in decomposition.items()
+        for label, matrix in matrices.items()
+    )
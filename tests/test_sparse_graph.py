@@ -0,0 +1,65 @@
+import numpy as np
+from pyformlang.finite_automaton import Epsilon
+
+from project import graph_utils
+from project.finite_automatons_utils import (
+    bfs_based_rpq,
+    bfs_based_rpq_from_graph_and_regex,
+    build_dfa_from_regex,
+    rpq,
+)
+from project.sparse_graph import LabeledGraph, VertexIndex
+
+
+def test_vertex_index_with_integer_ids():
+    index = VertexIndex([5, 3, 0, 9])
+
+    assert len(index) == 4
+    assert index.indexes([9, 0, 7, -1]).tolist() == [3, 2, -1, -1]
+    assert index.to_ids(np.array([[0, 3], [1, 2]])).tolist() == [[5, 9], [3, 0]]
+    assert index.mask([3, 9, 100]).tolist() == [False, True, False, True]
+    assert 5 in index and 4 not in index
+
+
+def test_vertex_index_with_arbitrary_ids():
+    index = VertexIndex(["b", ("x", 1), 7])
+    assert VertexIndex([(0, 1), (1, 2)]).indexes([(1, 2)]).tolist() == [1]
+
+    assert index.indexes([("x", 1), "a", 7]).tolist() == [1, -1, 2]
+    assert index.to_ids(np.array([2, 0])).tolist() == [7, "b"]
+    assert index.mask(None).all()
+    assert list(index) == ["b", ("x", 1), 7]
+
+
+def test_labeled_graph_round_trip():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(3, 2, ("a", "b"))
+    graph.add_edge(0, "x")
+    labeled = LabeledGraph.from_networkx(graph)
+
+    assert labeled.number_of_nodes() == 7 and labeled.number_of_edges() == 8
+    assert set(labeled.labels) == {"a", "b", Epsilon()}
+    assert set(zip(*labeled.reverse_matrices["b"].nonzero())) == {
+        (j, i) for i, j in zip(*labeled.matrices["b"].nonzero())
+    }
+
+    restored = labeled.to_networkx()
+    assert list(restored.nodes) == list(graph.nodes)
+    assert sorted(map(str, restored.edges(data="label"))) == sorted(
+        map(str, graph.edges(data="label"))
+    )
+    assert graph_utils.get_graph_info(labeled) == graph_utils.get_graph_info(graph)
+
+
+def test_engines_accept_labeled_graph():
+    graph = graph_utils.create_labeled_graph_with_two_cycle(4, 3, ("a", "b"))
+    labeled = LabeledGraph.from_networkx(graph)
+    regex = "a* b"
+
+    assert rpq(regex, labeled) == rpq(regex, graph)
+    for separately in (True, False):
+        assert bfs_based_rpq_from_graph_and_regex(
+            labeled, regex, separately, [0]
+        ) == bfs_based_rpq_from_graph_and_regex(graph, regex, separately, [0])
+        assert bfs_based_rpq(
+            labeled, build_dfa_from_regex(regex), separately
+        ) == bfs_based_rpq_from_graph_and_regex(graph, regex, separately)
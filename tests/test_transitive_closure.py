@@ -1,12 +1,29 @@
+from functools import partial
+
+import pytest
 from pyformlang.cfg import Variable, CFG
 import cfpq_data
 
 import project.cfpg.helling as helling
 import project.cfpg.matrix as matrix
+from project.sparse_graph import LabeledGraph
+
+
+@pytest.mark.parametrize("backend", [None, "csr", "dense", "bitset"])
+def test_matrix(backend):
+    check(partial(matrix.cfpg_transitive_closure, backend=backend))
 
 
-def test_matrix():
-    check(matrix.cfpg_transitive_closure)
+def test_streamed_matrix():
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+    cfg = CFG.from_text("S -> a S b S | $", Variable("S"))
+    expected = matrix.cfpg_transitive_closure(graph, cfg, {0, 1, 3}, None)
+
+    blocks = list(
+        matrix.iter_cfpg_transitive_closure(graph, cfg, {0, 1, 3}, chunk_size=1)
+    )
+    assert len(blocks) == 3
+    assert {tuple(pair) for block in blocks for pair in block.tolist()} == expected
 
 
 def test_hellings():
@@ -19,6 +36,10 @@ def check(transitive_closure_func):
         cfg = CFG.from_text(cfg_text, Variable("S"))
 
         assert transitive_closure_func(graph, cfg) == expected_edges
+        assert (
+            transitive_closure_func(LabeledGraph.from_networkx(graph), cfg)
+            == expected_edges
+        )
 
     local("S -> a b", {(2, 3)})
     local(